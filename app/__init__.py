@@ -1,6 +1,14 @@
 from fastapi import FastAPI
 from app.database import db
-from app.main.controller import user_controller, auth_controller
+from app.keys import key_material
+from app.http_client import http_client
+from app.metrics import metrics
+from app.responses import DefaultJSONResponse
+from app.workers import worker_health
+from app.main.controller import (user_controller, auth_controller,
+                                 health_controller, metrics_controller)
+from app.main.services.bulk_user_service import import_hash_pool
+from app.main.services.password_service import password_hasher
 
 PROJECT_VERSION = '0.1.0'
 PROJECT_NAME = 'BlueSky'
@@ -12,12 +20,23 @@ def create_app(config_name):
         title=PROJECT_NAME,
         description=PROJECT_DESCRIPTION,
         version=PROJECT_VERSION,
+        default_response_class=DefaultJSONResponse,
     )
 
     db.init_app(app)
+    key_material.init_app(app)
+    password_hasher.init_app(app)
+    import_hash_pool.init_app(app)
+    http_client.init_app(app)
+    metrics.init_app(app)
+    worker_health.init_app(app)
 
     app.include_router(user_controller.router, prefix='/users', tags=['users'])
 
     app.include_router(auth_controller.router, prefix='/auth', tags=['auth'])
 
+    app.include_router(metrics_controller.router, tags=['metrics'])
+
+    app.include_router(health_controller.router, tags=['health'])
+
     return app
@@ -0,0 +1,124 @@
+""" Maintenance commands.
+
+    Usage:
+        python -m app.cli --help
+"""
+import click
+from app.database import db
+from app.main.services import (bulk_user_service, password_service,
+                               refresh_token_service, revocation_service)
+
+
+@click.group()
+def cli():
+    db.init_app(None)
+
+
+@cli.command('purge-refresh-tokens')
+@click.option('--batch-size',
+              default=1000,
+              show_default=True,
+              help='Rows deleted per transaction')
+def purge_refresh_tokens(batch_size):
+    """ Delete expired refresh tokens """
+    session = db.session()
+    try:
+        total = refresh_token_service.purge_expired(session, batch_size)
+    finally:
+        session.close()
+
+    click.echo(f'{total} expired refresh tokens deleted')
+
+
+@cli.command('purge-revoked-tokens')
+@click.option('--batch-size',
+              default=1000,
+              show_default=True,
+              help='Rows deleted per transaction')
+def purge_revoked_tokens(batch_size):
+    """ Delete revocations of tokens that have expired """
+    session = db.session()
+    try:
+        total = revocation_service.purge_expired(session, batch_size)
+    finally:
+        session.close()
+
+    click.echo(f'{total} expired token revocations deleted')
+
+
+@cli.command('calibrate-password-hash')
+@click.option('--scheme',
+              type=click.Choice(['bcrypt', 'argon2']),
+              default='bcrypt',
+              show_default=True)
+@click.option('--target-ms',
+              default=250,
+              show_default=True,
+              help='Longest acceptable verification time')
+def calibrate_password_hash(scheme, target_ms):
+    """ Find the highest hashing cost verifying within the target time """
+    settings, elapsed = password_service.calibrate(scheme, target_ms / 1000)
+
+    for name, value in settings.items():
+        click.echo(f'{name}={value}')
+    click.echo(f'# verify takes {elapsed * 1000:.0f} ms on this machine')
+
+
+@cli.command('import-users')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--format',
+              type=click.Choice(bulk_user_service.FORMATS),
+              help='Defaults to the file extension')
+@click.option('--batch-size',
+              default=1000,
+              show_default=True,
+              help='Rows inserted per transaction')
+def import_users(file, format, batch_size):
+    """ Create users from a CSV or NDJSON file ("-" for stdin) """
+    format = format or bulk_user_service.guess_format(file.name)
+
+    session = db.session()
+    try:
+        result = bulk_user_service.import_users(session, file, format,
+                                                batch_size)
+    finally:
+        session.close()
+
+    for row in result['rejected']:
+        click.echo(f'line {row["line"]}: {row["email"]}: {row["error"]}',
+                   err=True)
+    click.echo(f'{result["imported"]} users imported, '
+               f'{len(result["rejected"])} rows rejected '
+               f'in {result["elapsed_seconds"]:.2f}s '
+               f'({result["users_per_second"]:.1f} users/s)')
+    if result['hashed']:
+        click.echo(f'{result["hashed"]} passwords hashed in '
+                   f'{result["hash_seconds"]:.2f}s '
+                   f'({result["hashed"] / result["hash_seconds"]:.1f}/s)')
+
+
+@cli.command('export-users')
+@click.option('--output',
+              type=click.File('w', encoding='utf-8'),
+              default='-',
+              help='File to write, stdout by default')
+@click.option('--format',
+              type=click.Choice(bulk_user_service.FORMATS),
+              default=bulk_user_service.NDJSON,
+              show_default=True)
+@click.option('--include-password-hashes',
+              is_flag=True,
+              help='Export password hashes, to import into another server')
+def export_users(output, format, include_password_hashes):
+    """ Write every user as CSV or NDJSON """
+    session = db.session()
+    try:
+        for chunk in bulk_user_service.export_users(
+                session, format, include_password_hashes):
+            output.write(chunk)
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    cli()
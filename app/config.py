@@ -1,56 +1,210 @@
 import os
-from decouple import config
-from json import JSONEncoder
-import json
+from decouple import Csv, config
 import logging
-import jwt
 
 logger = logging.getLogger(__name__)
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
-def get_private_key():
-    filename = config("ACCESS_TOKEN_PRIVATE_KEY", default=None)
-    try:
-        with open(filename) as f:
-            key = f.read()
-            logger.info('Private key loaded')
-
-            return key
-    except Exception as err:
-        logger.error(f'Failed to load private key file: {str(err)}')
-
-
-def get_public_key():
-    filename = config("ACCESS_TOKEN_PUBLIC_KEY", default=None)
-    try:
-        with open(filename) as f:
-            key = f.read()
-            logger.info('Public key loaded')
-
-            return key
-    except Exception as err:
-        logger.error(f'Failed to load public key file: {str(err)}')
-
-
 class BaseConfig():
     API_PREFIX = '/api'
     TESTING = False
     DEBUG = False
 
-    ACCESS_TOKEN_PRIVATE_KEY = get_private_key()
-    ACCESS_TOKEN_PUBLIC_KEY = get_public_key()
+    # PEM files of the signing key pair, read when the keys are loaded on
+    # startup (see app.keys), not when this module is imported.
+    ACCESS_TOKEN_PRIVATE_KEY_FILE = config("ACCESS_TOKEN_PRIVATE_KEY",
+                                           default=None)
+    ACCESS_TOKEN_PUBLIC_KEY_FILE = config("ACCESS_TOKEN_PUBLIC_KEY",
+                                          default=None)
+    # Algorithm for RSA keys (RS256, RS384, PS256...). EC and Ed25519 keys
+    # always sign with ES256/ES384/ES512 and EdDSA respectively.
     ACCESS_TOKEN_ALGORITHM = config("ACCESS_TOKEN_ALGORITHM", default="RS256")
+    # Directory of extra PEM keys accepted for verification and published
+    # in the JWKS; ACCESS_TOKEN_ACTIVE_KEY names the file to sign with.
+    ACCESS_TOKEN_KEYS_DIR = config("ACCESS_TOKEN_KEYS_DIR", default=None)
+    ACCESS_TOKEN_ACTIVE_KEY = config("ACCESS_TOKEN_ACTIVE_KEY", default=None)
     ACCESS_TOKEN_EXPIRE_MINUTES = config("ACCESS_TOKEN_EXPIRE_MINUTES",
                                          default=30,
                                          cast=float)
     REFRESH_TOKEN_EXPIRE_MINUTES = config("REFRESH_TOKEN_EXPIRE_MINUTES",
                                           default=30,
                                           cast=float)
+    # "jwt" issues signed refresh tokens, "opaque" random tokens stored in
+    # the refresh_tokens table, rotated on every use.
+    REFRESH_TOKEN_MODE = config("REFRESH_TOKEN_MODE", default="jwt")
+    JWKS_MAX_AGE = config("JWKS_MAX_AGE", default=600, cast=int)
+
+    # Resolve the current user from the access token claims instead of
+    # loading it from the database on every authenticated request.
+    STATELESS_CURRENT_USER = config("STATELESS_CURRENT_USER",
+                                    default=False,
+                                    cast=bool)
+
+    # Revoked token ids are mirrored in a per worker bloom filter, synced
+    # from the database every REVOCATION_REFRESH_INTERVAL seconds. Each sync
+    # overlaps the previous one by REVOCATION_SYNC_MARGIN seconds, which
+    # must exceed the longest revoking transaction and the clock skew
+    # between servers.
+    REVOCATION_BLOOM_CAPACITY = config("REVOCATION_BLOOM_CAPACITY",
+                                       default=100000,
+                                       cast=int)
+    REVOCATION_BLOOM_ERROR_RATE = config("REVOCATION_BLOOM_ERROR_RATE",
+                                         default=0.001,
+                                         cast=float)
+    REVOCATION_REFRESH_INTERVAL = config("REVOCATION_REFRESH_INTERVAL",
+                                         default=5,
+                                         cast=float)
+    REVOCATION_SYNC_MARGIN = config("REVOCATION_SYNC_MARGIN",
+                                    default=60,
+                                    cast=float)
+
+    # Decoded access token claims are kept until the token expires so a
+    # repeated bearer token skips RSA verification. 0 disables the cache.
+    VERIFIED_TOKEN_CACHE_SIZE = config("VERIFIED_TOKEN_CACHE_SIZE",
+                                       default=10000,
+                                       cast=int)
+
+    # Read-through cache for user lookups by email. USER_CACHE_URL adds a
+    # Redis cache shared by all workers in front of the database.
+    USER_CACHE_SIZE = config("USER_CACHE_SIZE", default=10000, cast=int)
+    USER_CACHE_TTL = config("USER_CACHE_TTL", default=60, cast=float)
+    USER_CACHE_URL = config("USER_CACHE_URL", default=None)
+
+    # New passwords are hashed with the first scheme of PASSWORD_SCHEMES.
+    # Hashes of the other schemes, or with a lower cost than configured,
+    # are replaced on the next successful login.
+    PASSWORD_SCHEMES = config("PASSWORD_SCHEMES", default="bcrypt", cast=Csv())
+    PASSWORD_BCRYPT_ROUNDS = config("PASSWORD_BCRYPT_ROUNDS",
+                                    default=12,
+                                    cast=int)
+    PASSWORD_ARGON2_TIME_COST = config("PASSWORD_ARGON2_TIME_COST",
+                                       default=2,
+                                       cast=int)
+    PASSWORD_ARGON2_MEMORY_COST = config("PASSWORD_ARGON2_MEMORY_COST",
+                                         default=19456,
+                                         cast=int)
+    PASSWORD_ARGON2_PARALLELISM = config("PASSWORD_ARGON2_PARALLELISM",
+                                         default=1,
+                                         cast=int)
+
+    # Password hashing runs in a bounded pool ("thread" or "process") so
+    # bcrypt never executes on the event loop thread.
+    PASSWORD_HASH_EXECUTOR = config("PASSWORD_HASH_EXECUTOR", default="thread")
+    PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS",
+                                   default=min(4, os.cpu_count() or 1),
+                                   cast=int)
+    PASSWORD_HASH_MAX_PENDING = config("PASSWORD_HASH_MAX_PENDING",
+                                       default=64,
+                                       cast=int)
+    # Process pool hashing the passwords of bulk user creation and imports
+    PASSWORD_BULK_HASH_WORKERS = config("PASSWORD_BULK_HASH_WORKERS",
+                                        default=os.cpu_count() or 1,
+                                        cast=int)
+    # Processes hashing the passwords of POST /users/import, shared by the
+    # imports of a worker, which run one at a time
+    PASSWORD_IMPORT_HASH_WORKERS = config("PASSWORD_IMPORT_HASH_WORKERS",
+                                          default=1,
+                                          cast=int)
+
+    # Token buckets throttling POST /auth/token per client IP and per
+    # account: up to *_BURST attempts at once, refilled at *_RATE attempts
+    # per second. LOGIN_RATE_LIMIT_URL shares the buckets through Redis.
+    LOGIN_RATE_LIMIT_ENABLED = config("LOGIN_RATE_LIMIT_ENABLED",
+                                      default=True,
+                                      cast=bool)
+    LOGIN_RATE_LIMIT_IP_RATE = config("LOGIN_RATE_LIMIT_IP_RATE",
+                                      default=1,
+                                      cast=float)
+    LOGIN_RATE_LIMIT_IP_BURST = config("LOGIN_RATE_LIMIT_IP_BURST",
+                                       default=20,
+                                       cast=int)
+    LOGIN_RATE_LIMIT_ACCOUNT_RATE = config("LOGIN_RATE_LIMIT_ACCOUNT_RATE",
+                                           default=0.1,
+                                           cast=float)
+    LOGIN_RATE_LIMIT_ACCOUNT_BURST = config("LOGIN_RATE_LIMIT_ACCOUNT_BURST",
+                                            default=10,
+                                            cast=int)
+    LOGIN_RATE_LIMIT_SIZE = config("LOGIN_RATE_LIMIT_SIZE",
+                                   default=100000,
+                                   cast=int)
+    LOGIN_RATE_LIMIT_URL = config("LOGIN_RATE_LIMIT_URL", default=None)
+
+    # Shared HTTP client used to call social providers. Timeouts and the
+    # concurrency cap can be overridden per provider (FACEBOOK_*).
+    HTTP_CLIENT_POOL_SIZE = config("HTTP_CLIENT_POOL_SIZE",
+                                   default=100,
+                                   cast=int)
+    HTTP_CLIENT_KEEPALIVE_TIMEOUT = config("HTTP_CLIENT_KEEPALIVE_TIMEOUT",
+                                           default=30,
+                                           cast=float)
+    HTTP_CLIENT_DNS_CACHE_TTL = config("HTTP_CLIENT_DNS_CACHE_TTL",
+                                       default=300,
+                                       cast=int)
+    HTTP_CLIENT_CONNECT_TIMEOUT = config("HTTP_CLIENT_CONNECT_TIMEOUT",
+                                         default=2,
+                                         cast=float)
+    HTTP_CLIENT_READ_TIMEOUT = config("HTTP_CLIENT_READ_TIMEOUT",
+                                      default=5,
+                                      cast=float)
+    HTTP_CLIENT_MAX_CONCURRENCY = config("HTTP_CLIENT_MAX_CONCURRENCY",
+                                         default=50,
+                                         cast=int)
+
+    FACEBOOK_GRAPH_URL = config("FACEBOOK_GRAPH_URL",
+                                default="https://graph.facebook.com")
+    FACEBOOK_CONNECT_TIMEOUT = config("FACEBOOK_CONNECT_TIMEOUT",
+                                      default=HTTP_CLIENT_CONNECT_TIMEOUT,
+                                      cast=float)
+    FACEBOOK_READ_TIMEOUT = config("FACEBOOK_READ_TIMEOUT",
+                                   default=HTTP_CLIENT_READ_TIMEOUT,
+                                   cast=float)
+    FACEBOOK_MAX_CONCURRENCY = config("FACEBOOK_MAX_CONCURRENCY",
+                                      default=HTTP_CLIENT_MAX_CONCURRENCY,
+                                      cast=int)
+
+    # Recently resolved social tokens, keyed by provider and token digest.
+    SOCIAL_TOKEN_CACHE_SIZE = config("SOCIAL_TOKEN_CACHE_SIZE",
+                                     default=10000,
+                                     cast=int)
+    SOCIAL_TOKEN_CACHE_TTL = config("SOCIAL_TOKEN_CACHE_TTL",
+                                    default=30,
+                                    cast=float)
+    SOCIAL_TOKEN_NEGATIVE_CACHE_TTL = config("SOCIAL_TOKEN_NEGATIVE_CACHE_TTL",
+                                             default=10,
+                                             cast=float)
+
+    # Prefork server (python -m app.server). SERVER_WORKERS=0 starts one
+    # worker per CPU. Workers whose heartbeat is older than
+    # SERVER_WORKER_TIMEOUT seconds are replaced, and on shutdown they get
+    # SERVER_GRACEFUL_TIMEOUT seconds to finish their requests.
+    SERVER_HOST = config("SERVER_HOST", default="127.0.0.1")
+    SERVER_PORT = config("SERVER_PORT", default=8080, cast=int)
+    SERVER_WORKERS = config("SERVER_WORKERS", default=0, cast=int)
+    SERVER_WORKER_TIMEOUT = config("SERVER_WORKER_TIMEOUT",
+                                   default=30,
+                                   cast=float)
+    SERVER_GRACEFUL_TIMEOUT = config("SERVER_GRACEFUL_TIMEOUT",
+                                     default=30,
+                                     cast=float)
 
     SQLALCHEMY_DATABASE_URI = config("DATABASE_URI",
                                      default="sqlite:///" +
                                      os.path.join(basedir, "auth.db"))
+    # Optional read replica serving the user listing and current user
+    # lookups. Defaults to the primary database.
+    SQLALCHEMY_REPLICA_URI = config("DATABASE_REPLICA_URI", default=None)
+
+    # Connection pool of every worker process, so the database sees up to
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections. Ignored for
+    # SQLite, which does not pool file connections.
+    DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+    DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+    DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=float)
+    DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+    DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+    # Server side statement timeout in milliseconds (PostgreSQL), 0 for none
+    DB_STATEMENT_TIMEOUT = config("DB_STATEMENT_TIMEOUT", default=0, cast=int)
 
     def init_app(self, app):
         app.config = self
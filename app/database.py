@@ -1,14 +1,80 @@
+import time
 import warnings
+from datetime import datetime
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from app.config import appConfig
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
+from app.config import BaseConfig, appConfig
+from app.metrics import metrics
+
+pool_wait = metrics.histogram('db_pool_wait_seconds',
+                              'Time spent waiting for a pooled connection',
+                              ['bind'])
+pool_connections = metrics.gauge('db_pool_connections',
+                                 'Connections of the pool by state',
+                                 ['bind', 'state'])
+
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool recording how long each checkout waited for a
+        connection, which grows when the pool is too small for the load """
+    bind = 'primary'
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.observe(time.perf_counter() - start, bind=self.bind)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.bind = self.bind
+        return pool
+
+
+def engine_options(uri: str, config: BaseConfig):
+    """ create_engine keyword arguments for uri according to the DB_*
+        settings """
+    # Sessions are handed between the event loop and the threadpool
+    # (see run_sync), so SQLite must accept connections used from more
+    # than one thread.
+    if uri.startswith('sqlite'):
+        return dict(connect_args={"check_same_thread": False})
+
+    options = dict(poolclass=TimedQueuePool,
+                   pool_size=config.DB_POOL_SIZE,
+                   max_overflow=config.DB_MAX_OVERFLOW,
+                   pool_timeout=config.DB_POOL_TIMEOUT,
+                   pool_recycle=config.DB_POOL_RECYCLE,
+                   pool_pre_ping=config.DB_POOL_PRE_PING)
+
+    # Send executemany batches (bulk user import) as multi-row INSERTs
+    if uri.split('://')[0] in ('postgres', 'postgresql',
+                               'postgresql+psycopg2'):
+        options['executemany_mode'] = 'values'
+
+    if config.DB_STATEMENT_TIMEOUT and uri.startswith('postgres'):
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={config.DB_STATEMENT_TIMEOUT}'
+        }
+
+    return options
 
 
 class SQLAlchemy():
+    """ Engines and session factories of the primary database and of the
+        optional read replica.
+
+        Nothing connects when the module is imported: the engines are
+        created by the startup hook of each worker, or on first use.
+    """
     def __init__(self):
         self.Model = declarative_base()
         self.config = appConfig
+        self._engine = None
 
     def init_app(self, app):
         """
@@ -18,19 +84,90 @@ class SQLAlchemy():
                 'Neither SQLALCHEMY_DATABASE_URI nor SQLALCHEMY_BINDS is set. '
                 'Defaulting SQLALCHEMY_DATABASE_URI to "sqlite:///:memory:".')
         """
+        self._engine = None
+
+        if app is not None:
+            app.add_event_handler('startup', self.connect)
+
+    @property
+    def connected(self):
+        return self._engine is not None
+
+    def connect(self):
+        if self.connected:
+            return
 
         SQLALCHEMY_DATABASE_URI = self.config.SQLALCHEMY_DATABASE_URI
+        SQLALCHEMY_REPLICA_URI = self.config.SQLALCHEMY_REPLICA_URI
+
+        engine = self.create_engine(SQLALCHEMY_DATABASE_URI)
+        self._session = sessionmaker(autocommit=False,
+                                     autoflush=False,
+                                     bind=engine)
+
+        self._read_engine = engine
+        if SQLALCHEMY_REPLICA_URI:
+            self._read_engine = self.create_engine(SQLALCHEMY_REPLICA_URI,
+                                                   'replica')
+        self._read_session = sessionmaker(autocommit=False,
+                                          autoflush=False,
+                                          bind=self._read_engine)
+        self._engine = engine
+
+    @property
+    def engine(self):
+        self.connect()
+        return self._engine
+
+    @property
+    def session(self):
+        self.connect()
+        return self._session
+
+    @property
+    def read_engine(self):
+        self.connect()
+        return self._read_engine
 
-        #connect_args={"check_same_thread": False}
-        self.engine = create_engine(SQLALCHEMY_DATABASE_URI)
-        self.session = sessionmaker(autocommit=False,
-                                    autoflush=False,
-                                    bind=self.engine)
+    @property
+    def read_session(self):
+        self.connect()
+        return self._read_session
+
+    def create_engine(self, uri: str, bind: str = 'primary'):
+        engine = create_engine(uri, **engine_options(uri, self.config))
+        engine.pool.bind = bind
+        return engine
+
+    def pool_status(self):
+        """ bind -> connection counts of the engines using a QueuePool """
+        engines = dict(primary=self.engine)
+        if self.read_engine is not self.engine:
+            engines['replica'] = self.read_engine
+
+        return {
+            bind: dict(size=engine.pool.size(),
+                       checked_out=engine.pool.checkedout(),
+                       overflow=max(0, engine.pool.overflow()),
+                       idle=engine.pool.checkedin())
+            for bind, engine in engines.items()
+            if isinstance(engine.pool, QueuePool)
+        }
 
 
 db = SQLAlchemy()
 
 
+@metrics.on_collect
+def collect_pool_status():
+    if not db.connected:
+        return
+
+    for bind, status in db.pool_status().items():
+        for state, value in status.items():
+            pool_connections.set(value, bind=bind, state=state)
+
+
 # Dependency
 def get_db():
     try:
@@ -38,3 +175,42 @@ def get_db():
         yield x
     finally:
         x.close()
+
+
+def get_read_db():
+    """ Session on the read replica, for endpoints that only read and can
+        tolerate replication lag """
+    try:
+        x = db.read_session()
+        yield x
+    finally:
+        x.close()
+
+
+async def run_sync(fn, *args, **kwargs):
+    """ Run a blocking database call in the threadpool so that async
+        endpoints do not stall the event loop while waiting on the
+        database """
+    return await run_in_threadpool(fn, *args, **kwargs)
+
+
+def delete_expired(session, model, batch_size: int = 1000):
+    """ Delete the rows of model whose expires_at has passed, in batches of
+        batch_size rows, each in its own transaction so that no lock is
+        held for long, and return the number deleted """
+    now = datetime.utcnow()
+    total = 0
+
+    while True:
+        ids = [
+            id for id, in session.query(model.id).filter(
+                model.expires_at <= now).limit(batch_size)
+        ]
+        if not ids:
+            break
+
+        total += session.query(model).filter(model.id.in_(ids)).delete(
+            synchronize_session=False)
+        session.commit()
+
+    return total
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import aiohttp
+from app.config import appConfig
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderBusyError(Exception):
+    pass
+
+
+class HttpClient():
+    """ Application wide aiohttp session used to call external providers.
+
+        Connections are pooled and kept alive between requests. Each
+        provider gets its own timeouts and a cap on concurrent requests,
+        read from <PROVIDER>_CONNECT_TIMEOUT, <PROVIDER>_READ_TIMEOUT and
+        <PROVIDER>_MAX_CONCURRENCY, falling back to the HTTP_CLIENT_*
+        defaults.
+    """
+    def __init__(self):
+        self.config = appConfig
+        self._session = None
+        self._semaphores = {}
+
+    def init_app(self, app):
+        app.add_event_handler('startup', self.startup)
+        app.add_event_handler('shutdown', self.shutdown)
+
+    async def startup(self):
+        if self._session is None:
+            self._session = self.create_session()
+
+    async def shutdown(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._semaphores = {}
+
+    def create_session(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.config.HTTP_CLIENT_POOL_SIZE,
+            keepalive_timeout=self.config.HTTP_CLIENT_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=self.config.HTTP_CLIENT_DNS_CACHE_TTL)
+        return aiohttp.ClientSession(connector=connector)
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = self.create_session()
+
+        return self._session
+
+    def setting(self, provider: str, name: str):
+        default = getattr(self.config, f'HTTP_CLIENT_{name}')
+        return getattr(self.config, f'{provider.upper()}_{name}', default)
+
+    def timeout(self, provider: str):
+        return aiohttp.ClientTimeout(
+            connect=self.setting(provider, 'CONNECT_TIMEOUT'),
+            sock_read=self.setting(provider, 'READ_TIMEOUT'))
+
+    def semaphore(self, provider: str):
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(
+                self.setting(provider, 'MAX_CONCURRENCY'))
+
+        return self._semaphores[provider]
+
+    async def get_json(self, provider: str, url: str, **kwargs):
+        """ GET url and return (status, json body) """
+        semaphore = self.semaphore(provider)
+
+        try:
+            await asyncio.wait_for(semaphore.acquire(),
+                                   self.setting(provider, 'CONNECT_TIMEOUT'))
+        except asyncio.TimeoutError:
+            logger.warning(f'Too many concurrent requests to {provider}')
+            raise ProviderBusyError(f'{provider} is busy, try again later')
+
+        try:
+            async with self.session.get(url,
+                                        timeout=self.timeout(provider),
+                                        **kwargs) as response:
+                return response.status, await response.json()
+        finally:
+            semaphore.release()
+
+
+http_client = HttpClient()
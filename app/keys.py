@@ -0,0 +1,223 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from app.config import appConfig
+
+logger = logging.getLogger(__name__)
+
+
+def b64url(data: bytes):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64url_uint(value: int, size: int = None):
+    size = size or (value.bit_length() + 7) // 8 or 1
+    return b64url(value.to_bytes(size, 'big'))
+
+
+# JWK members that identify a key, per key type (RFC 7638)
+THUMBPRINT_MEMBERS = {
+    'RSA': ('e', 'kty', 'n'),
+    'EC': ('crv', 'kty', 'x', 'y'),
+    'OKP': ('crv', 'kty', 'x'),
+}
+
+EC_CURVES = {
+    'secp256r1': ('P-256', 'ES256'),
+    'secp384r1': ('P-384', 'ES384'),
+    'secp521r1': ('P-521', 'ES512'),
+}
+
+
+def jwk_thumbprint(jwk: dict):
+    """ RFC 7638 thumbprint of the required members of a public JWK """
+    required = {k: jwk[k] for k in THUMBPRINT_MEMBERS[jwk['kty']]}
+    canonical = json.dumps(required, sort_keys=True, separators=(',', ':'))
+    return b64url(hashlib.sha256(canonical.encode('utf8')).digest())
+
+
+def public_jwk(public_key, rsa_algorithm: str):
+    """ Public JWK of a key and the JWS algorithm it signs with """
+    if isinstance(public_key, rsa.RSAPublicKey):
+        numbers = public_key.public_numbers()
+        jwk = dict(kty='RSA',
+                   n=b64url_uint(numbers.n),
+                   e=b64url_uint(numbers.e))
+        return jwk, rsa_algorithm
+
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        crv, algorithm = EC_CURVES[public_key.curve.name]
+        size = (public_key.curve.key_size + 7) // 8
+        numbers = public_key.public_numbers()
+        jwk = dict(kty='EC',
+                   crv=crv,
+                   x=b64url_uint(numbers.x, size),
+                   y=b64url_uint(numbers.y, size))
+        return jwk, algorithm
+
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        raw = public_key.public_bytes(serialization.Encoding.Raw,
+                                      serialization.PublicFormat.Raw)
+        return dict(kty='OKP', crv='Ed25519', x=b64url(raw)), 'EdDSA'
+
+    raise ValueError(f'Unsupported key type: {type(public_key).__name__}')
+
+
+class KeyMaterialError(Exception):
+    pass
+
+
+def load_pem_key(pem: bytes):
+    """ Parse a PEM private or public key, returning (private, public) """
+    try:
+        private_key = serialization.load_pem_private_key(pem, password=None)
+        return private_key, private_key.public_key()
+    except ValueError:
+        return None, serialization.load_pem_public_key(pem)
+
+
+def load_key_file(path: str):
+    try:
+        with open(path, 'rb') as f:
+            return load_pem_key(f.read())
+    except Exception as err:
+        raise KeyMaterialError(f'Failed to load key file {path}: {str(err)}')
+
+
+class SigningKey():
+    """ One key of the ring. Keys without a private part only verify.
+
+        The JWS algorithm follows the key type: RSA keys use
+        ACCESS_TOKEN_ALGORITHM, EC keys ES256/ES384/ES512 by curve and
+        Ed25519 keys EdDSA.
+    """
+    def __init__(self, public_key, private_key=None, rsa_algorithm='RS256'):
+        self.public_key = public_key
+        self.private_key = private_key
+
+        self.jwk, self.algorithm = public_jwk(public_key, rsa_algorithm)
+        self.kid = jwk_thumbprint(self.jwk)
+        self.jwk.update(alg=self.algorithm, kid=self.kid, use='sig')
+
+
+class KeyMaterial():
+    """ Ring of token keys, parsed once from PEM into ready to use
+        cryptography key objects.
+
+        Tokens are signed with the active key and verified with the key
+        named by their kid header, so keys can be rotated without
+        invalidating tokens signed by the previous one. Every key found in
+        ACCESS_TOKEN_KEYS_DIR is published in the JWKS document.
+
+        Keys are loaded by the application startup hook, or by the server
+        before forking workers, and on first use otherwise. A key file that
+        can not be read, or no signing key at all, fails the load.
+    """
+    def __init__(self):
+        self.config = appConfig
+        self.keys = {}
+        self.active = None
+        self.loaded = False
+        self._jwks = None
+        self._jwks_etag = None
+
+    def init_app(self, app):
+        app.add_event_handler('startup', self.ensure_loaded)
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def add(self, private_key, public_key):
+        key = SigningKey(public_key, private_key,
+                         self.config.ACCESS_TOKEN_ALGORITHM)
+
+        known = self.keys.get(key.kid)
+        if known is None or known.private_key is None:
+            self.keys[key.kid] = key
+
+        return self.keys[key.kid]
+
+    def load_dir(self, directory: str):
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.pem'):
+                continue
+
+            key = self.add(*load_key_file(os.path.join(directory, filename)))
+            if filename == self.config.ACCESS_TOKEN_ACTIVE_KEY:
+                self.active = key
+
+    def load(self):
+        self.keys = {}
+        self.active = None
+
+        private_file = self.config.ACCESS_TOKEN_PRIVATE_KEY_FILE
+        public_file = self.config.ACCESS_TOKEN_PUBLIC_KEY_FILE
+
+        if private_file:
+            self.active = self.add(*load_key_file(private_file))
+        if public_file:
+            self.add(*load_key_file(public_file))
+
+        if self.config.ACCESS_TOKEN_KEYS_DIR:
+            self.load_dir(self.config.ACCESS_TOKEN_KEYS_DIR)
+
+        if self.active is None or self.active.private_key is None:
+            raise KeyMaterialError(
+                'No signing key, set ACCESS_TOKEN_PRIVATE_KEY or '
+                'ACCESS_TOKEN_KEYS_DIR and ACCESS_TOKEN_ACTIVE_KEY')
+
+        self._jwks = json.dumps(
+            dict(keys=[key.jwk for key in self.keys.values()])).encode('utf8')
+        self._jwks_etag = '"' + hashlib.sha256(self._jwks).hexdigest() + '"'
+
+        self.loaded = True
+        logger.info(f'{len(self.keys)} token keys loaded')
+
+    @property
+    def jwks(self):
+        """ JWKS document of every key, built once per load """
+        self.ensure_loaded()
+        return self._jwks
+
+    @property
+    def jwks_etag(self):
+        self.ensure_loaded()
+        return self._jwks_etag
+
+    @property
+    def signing_key(self):
+        if not self.loaded:
+            self.load()
+        if self.active is None:
+            raise jwt.InvalidKeyError('No active signing key')
+        return self.active
+
+    @property
+    def private_key(self):
+        return self.signing_key.private_key
+
+    @property
+    def public_key(self):
+        return self.signing_key.public_key
+
+    @property
+    def kid(self):
+        return self.signing_key.kid
+
+    def verification_key(self, token: str):
+        """ Key for the token's kid header, falling back to the active key
+            for tokens issued without a known kid """
+        if not self.loaded:
+            self.load()
+
+        kid = jwt.get_unverified_header(token).get('kid')
+        return self.keys.get(kid) or self.signing_key
+
+
+key_material = KeyMaterial()
@@ -1,22 +1,36 @@
+import hashlib
 import logging
+import math
 import jwt
 from sqlalchemy.orm import Session
-from starlette.status import HTTP_401_UNAUTHORIZED
-from fastapi import Depends, APIRouter, HTTPException
+from starlette.status import (HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST,
+                              HTTP_401_UNAUTHORIZED,
+                              HTTP_429_TOO_MANY_REQUESTS,
+                              HTTP_503_SERVICE_UNAVAILABLE)
+from fastapi import Depends, APIRouter, HTTPException, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from passlib.context import CryptContext
-from datetime import timedelta
-from app.database import get_db
+from datetime import datetime, timedelta
+from app.database import get_db, run_sync
+from app.http_client import ProviderBusyError
 from app.config import BaseConfig, get_config
-from ..services import user_service
+from app.keys import key_material
+from app.metrics import metrics
+from ..services import user_service, refresh_token_service
 from ..schemas import user as user_schema
 from ..schemas import token as token_schema
 from ..schemas import jwks as jwks_schema
 
+from ..services.exceptions import ProviderUnavailableError
 from ..services.social_login_service import SocialLoginService
+from ..services.password_service import password_hasher
+from ..services.rate_limit_service import login_rate_limiter
+from ..services.revocation_service import revocation_list
 
 router = APIRouter()
 
+OPAQUE_REFRESH_TOKEN = 'opaque'
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,25 +41,32 @@ def get_token_data(token: str, config: BaseConfig):
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    payload = jwt.decode(token,
-                         config.ACCESS_TOKEN_PUBLIC_KEY,
-                         algorithms=[config.ACCESS_TOKEN_ALGORITHM])
+    payload = user_service.decode_token(token, config)
 
     username: str = payload.get("sub")
     if username is None:
         raise credentials_exception
-    token_data = token_schema.TokenData(username=username)
+    token_data = token_schema.TokenData(username=username,
+                                        jti=payload.get("jti"))
 
     return token_data
 
 
-def authenticate_user(db, username: str, password: str):
-    user = user_service.get_user(db, username)
+async def authenticate_user(db, username: str, password: str):
+    with metrics.stage('login', 'user_lookup'):
+        user = await user_service.get_user_async(db, username)
     if not user:
         return False
 
-    if not user.password == password:
+    with metrics.stage('login', 'password_verify'):
+        verified, new_hash = await password_hasher.verify_and_update(
+            user.password, password)
+    if not verified:
         return False
+
+    if new_hash is not None:
+        with metrics.stage('login', 'password_rehash'):
+            await user_service.update_password_async(db, user, new_hash)
     return user
 
 
@@ -58,7 +79,20 @@ def create_token(*,
     return token
 
 
-def create_full_token(user: user_schema.User, config: BaseConfig):
+async def create_refresh_token(db, user, config: BaseConfig):
+    if config.REFRESH_TOKEN_MODE == OPAQUE_REFRESH_TOKEN:
+        return await run_sync(refresh_token_service.issue, db, user, config)
+
+    refresh_token_expires = timedelta(
+        minutes=config.REFRESH_TOKEN_EXPIRE_MINUTES)
+    return create_token(data={"sub": user.email},
+                        expires_delta=refresh_token_expires,
+                        config=config)
+
+
+def create_full_token(user: user_schema.User,
+                      config: BaseConfig,
+                      refresh_token: str = None):
     access_token_expires = timedelta(
         minutes=config.ACCESS_TOKEN_EXPIRE_MINUTES)
 
@@ -66,17 +100,19 @@ def create_full_token(user: user_schema.User, config: BaseConfig):
         'sub': user.email,
         'name': user.name,
         'picture': user.picture,
+        **user_service.get_user_claims(user),
     }
 
     access_token = create_token(data=access_token_data,
                                 expires_delta=access_token_expires,
                                 config=config)
 
-    refresh_token_expires = timedelta(
-        minutes=config.REFRESH_TOKEN_EXPIRE_MINUTES)
-    refresh_token = create_token(data={"sub": user.email},
-                                 expires_delta=refresh_token_expires,
-                                 config=config)
+    if refresh_token is None:
+        refresh_token_expires = timedelta(
+            minutes=config.REFRESH_TOKEN_EXPIRE_MINUTES)
+        refresh_token = create_token(data={"sub": user.email},
+                                     expires_delta=refresh_token_expires,
+                                     config=config)
 
     return {
         "access_token": access_token,
@@ -85,14 +121,65 @@ def create_full_token(user: user_schema.User, config: BaseConfig):
     }
 
 
+def consume_legacy_refresh_token(db: Session, token: str, config: BaseConfig):
+    """ JWT refresh tokens issued before switching to opaque mode are
+        exchanged for an opaque one once: they are revoked on first use.
+        Returns the token subject, None when the token was already
+        exchanged or is an access token. """
+    payload = user_service.decode_token(token, config)
+
+    # Access tokens carry the user claims, refresh tokens only sub
+    if payload.get('sub') is None or 'name' in payload:
+        return None
+
+    # Tokens issued before jti was added are identified by their hash
+    jti = (payload.get('jti')
+           or hashlib.sha256(token.encode('utf8')).hexdigest()[:32])
+    if not revocation_list.revoke(db, jti,
+                                  datetime.utcfromtimestamp(payload['exp'])):
+        return None
+
+    return payload['sub']
+
+
 @router.post("/refresh-token", response_model=token_schema.Token)
 async def get_access_token_from_refresh_token(
         token: token_schema.RefreshToken,
         db: Session = Depends(get_db),
         config: BaseConfig = Depends(get_config)):
 
-    token_data = get_token_data(token.refresh_token, config)
-    user = user_service.get_user(db, email=token_data.username)
+    if (config.REFRESH_TOKEN_MODE == OPAQUE_REFRESH_TOKEN
+            and token.refresh_token.count('.') != 2):
+        try:
+            with metrics.stage('refresh', 'rotate'):
+                user, refresh_token = await run_sync(
+                    refresh_token_service.rotate, db, token.refresh_token,
+                    config)
+        except refresh_token_service.InvalidRefreshTokenError as err:
+            raise HTTPException(
+                status_code=HTTP_401_UNAUTHORIZED,
+                detail=str(err),
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        with metrics.stage('refresh', 'token_sign'):
+            return create_full_token(user, config, refresh_token)
+
+    user = None
+    username = None
+    if config.REFRESH_TOKEN_MODE == OPAQUE_REFRESH_TOKEN:
+        with metrics.stage('refresh', 'legacy_exchange'):
+            username = await run_sync(consume_legacy_refresh_token, db,
+                                      token.refresh_token, config)
+    else:
+        with metrics.stage('refresh', 'token_decode'):
+            token_data = get_token_data(token.refresh_token, config)
+        if not await revocation_list.is_revoked_async(db, token_data.jti):
+            username = token_data.username
+
+    if username:
+        with metrics.stage('refresh', 'user_lookup'):
+            user = await user_service.get_user_async(db, email=username)
 
     if not user:
         raise HTTPException(
@@ -101,16 +188,31 @@ async def get_access_token_from_refresh_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return create_full_token(user, config)
+    refresh_token = await create_refresh_token(db, user, config)
+    with metrics.stage('refresh', 'token_sign'):
+        return create_full_token(user, config, refresh_token)
 
 
 @router.post("/token", response_model=token_schema.Token)
 async def login_for_access_token(
+        request: Request,
         db: Session = Depends(get_db),
         form_data: OAuth2PasswordRequestForm = Depends(),
         config: BaseConfig = Depends(get_config)):
 
-    user = authenticate_user(db, form_data.username, form_data.password)
+    # Throttle before the user lookup and password verification, the
+    # expensive part of a login
+    retry_after = await login_rate_limiter.hit_async(request.client.host,
+                                                     form_data.username)
+    if retry_after:
+        raise HTTPException(
+            status_code=HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    user = await authenticate_user(db, form_data.username,
+                                   form_data.password)
     if not user:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
@@ -118,7 +220,9 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return create_full_token(user, config)
+    refresh_token = await create_refresh_token(db, user, config)
+    with metrics.stage('login', 'token_sign'):
+        return create_full_token(user, config, refresh_token)
 
 
 @router.post("/swap-social-token", response_model=token_schema.Token)
@@ -131,6 +235,13 @@ async def swap_social_token_for_access_token(
     errMsg = None
     try:
         user = await social_login_service.get_user(db, social_token)
+    except (ProviderBusyError, ProviderUnavailableError) as err:
+        logger.error(str(err))
+        raise HTTPException(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(err),
+            headers={"Retry-After": "1"},
+        )
     except Exception as err:
         errMsg = str(err)
         user = None
@@ -143,20 +254,50 @@ async def swap_social_token_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return create_full_token(user, config)
+    refresh_token = await create_refresh_token(db, user, config)
+    with metrics.stage('social_swap', 'token_sign'):
+        return create_full_token(user, config, refresh_token)
 
 
-@router.get("/.well-known/jwks.json", response_model=jwks_schema.Jwks)
-async def jwks(config: BaseConfig = Depends(get_config)):
-    public_key = config.ACCESS_TOKEN_PUBLIC_KEY.split('\n')
-    public_key = public_key[1:8]
+@router.post("/revoke")
+async def revoke_token(token: token_schema.RevokeToken,
+                       db: Session = Depends(get_db),
+                       config: BaseConfig = Depends(get_config)):
+    """ Revoke an access or JWT refresh token until it expires """
+    try:
+        payload = user_service.decode_token(token.token, config)
+    except jwt.PyJWTError as err:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail=f"Invalid token: {str(err)}",
+        )
+
+    if payload.get("jti") is None:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
+                            detail="Token can not be revoked")
+
+    await run_sync(revocation_list.revoke, db, payload["jti"],
+                   datetime.utcfromtimestamp(payload["exp"]))
+
+    return {"revoked": True}
 
-    key_item = dict(alg=config.ACCESS_TOKEN_ALGORITHM,
-                    kid='3q1sysizPaTHQhb+xErwIZfZymN+46UmssneP0vPkes=',
-                    kty='RSA',
-                    n=''.join(public_key),
-                    use='sig')
 
-    results = dict(keys=[key_item])
+@router.get("/.well-known/jwks.json", response_model=jwks_schema.Jwks)
+async def jwks(request: Request, config: BaseConfig = Depends(get_config)):
+    """ Serve the JWKS document built once when the keys were loaded """
+    etag = key_material.jwks_etag
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'public, max-age={config.JWKS_MAX_AGE}',
+    }
+
+    if_none_match = [
+        tag.strip()
+        for tag in request.headers.get('if-none-match', '').split(',')
+    ]
+    if etag in if_none_match or '*' in if_none_match:
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=headers)
 
-    return results
+    return Response(content=key_material.jwks,
+                    media_type='application/json',
+                    headers=headers)
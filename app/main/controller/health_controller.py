@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+from app.workers import worker_health
+
+router = APIRouter()
+
+
+@router.get("/health")
+async def health():
+    """ Liveness of the worker serving the request, and the heartbeat age
+        of every worker when run by app.server """
+    return dict(status='ok', **worker_health.status())
@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.metrics import metrics
+from ..services import user_service
+from ..services.password_service import password_hasher
+from ..services.social_login_service import social_token_cache
+
+router = APIRouter()
+
+cache_size = metrics.gauge('cache_size', 'Entries held by a cache', ['cache'])
+cache_hit_ratio = metrics.gauge('cache_hit_ratio', 'Hit ratio of a cache',
+                                ['cache'])
+password_hash_pending = metrics.gauge(
+    'password_hash_pending', 'Password hashes queued or running')
+
+
+@metrics.on_collect
+def collect():
+    caches = {
+        'verified_token': user_service.verified_token_cache.stats(),
+        'user': user_service.user_cache.stats(),
+        'social_token': social_token_cache.stats(),
+    }
+    for name, stats in caches.items():
+        cache_size.set(stats['size'], cache=name)
+        cache_hit_ratio.set(stats['hit_ratio'], cache=name)
+
+    password_hash_pending.set(password_hasher.pending)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return PlainTextResponse(metrics.render(),
+                             media_type='text/plain; version=0.0.4')
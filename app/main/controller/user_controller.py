@@ -1,14 +1,20 @@
+import codecs
 import logging
-import jwt
 from jwt import PyJWTError
 from typing import List
 from sqlalchemy.orm import Session
-from fastapi import Depends, APIRouter, HTTPException
+from fastapi import (Depends, APIRouter, File, HTTPException, Query,
+                     UploadFile)
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
-from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_400_BAD_REQUEST
-from app.database import get_db
+from starlette.status import (HTTP_401_UNAUTHORIZED, HTTP_400_BAD_REQUEST,
+                              HTTP_503_SERVICE_UNAVAILABLE)
+from app.database import get_db, get_read_db, run_sync
 from app.config import BaseConfig, get_config
-from ..services import user_service
+from app.metrics import metrics
+from app.responses import RawJSONResponse, dumps
+from ..services import user_service, bulk_user_service
+from ..services.revocation_service import revocation_list
 from ..schemas import user as user_schema
 from ..schemas import token as token_schema
 
@@ -19,7 +25,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 logger = logging.getLogger(__name__)
 
 
-async def get_current_user(db: Session = Depends(get_db),
+async def get_current_user(db: Session = Depends(get_read_db),
                            token: str = Depends(oauth2_scheme),
                            config: BaseConfig = Depends(get_config)):
     credentials_exception = HTTPException(
@@ -28,9 +34,8 @@ async def get_current_user(db: Session = Depends(get_db),
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token,
-                             config.ACCESS_TOKEN_PUBLIC_KEY,
-                             algorithms=[config.ACCESS_TOKEN_ALGORITHM])
+        with metrics.stage('verify', 'token_decode'):
+            payload = user_service.decode_access_token(token, config)
 
         username: str = payload.get("sub")
         if username is None:
@@ -43,7 +48,23 @@ async def get_current_user(db: Session = Depends(get_db),
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = user_service.get_user(db, email=token_data.username)
+    with metrics.stage('verify', 'revocation_check'):
+        revoked = await revocation_list.is_revoked_async(db, payload.get("jti"))
+    if revoked:
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED,
+            detail="Token revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    if config.STATELESS_CURRENT_USER:
+        user = user_service.get_user_from_claims(payload)
+        if user is not None:
+            return user
+
+    with metrics.stage('verify', 'user_load'):
+        user = await user_service.get_user_async(db,
+                                                 email=token_data.username)
 
     if user is None:
         raise credentials_exception
@@ -59,22 +80,108 @@ async def get_current_active_user(
     return current_user
 
 
+def ndjson_lines(rows):
+    for row in rows:
+        yield dumps(row) + b'\n'
+
+
+def user_row(user):
+    """ Public fields of a user, as in user_schema.User """
+    return {
+        field: getattr(user, field)
+        for field in user_schema.User.__fields__
+    }
+
+
 @router.get("/", response_model=List[user_schema.User], tags=['users'])
-async def read_users(db: Session = Depends(get_db),
+async def read_users(limit: int = Query(100, ge=1, le=1000),
+                     after_id: int = None,
+                     stream: bool = False,
+                     db: Session = Depends(get_read_db),
                      token: str = Depends(oauth2_scheme)):
-    return user_service.get_users(db)
+    """ List users ordered by id, one page at a time.
+
+        Pass the X-Next-After-Id header of a page as after_id to read the
+        next one. With stream=true every user after after_id is streamed
+        as NDJSON and limit is ignored.
+    """
+    if stream:
+        rows = user_service.iter_users(db, after_id)
+        return StreamingResponse(ndjson_lines(rows),
+                                 media_type='application/x-ndjson')
+
+    users = await user_service.get_users_async(db, limit, after_id)
+
+    # Rows are already validated by the query, skip the response_model
+    response = RawJSONResponse(users)
+    if len(users) == limit:
+        response.headers['X-Next-After-Id'] = str(users[-1]['id'])
+
+    return response
 
 
 @router.post("/", response_model=user_schema.User, tags=['users'])
-def create_user(user: user_schema.UserCreate, db: Session = Depends(get_db)):
-    db_user = user_service.get_user_by_email(db, email=user.email)
-    if db_user:
+async def create_user(user: user_schema.UserCreate,
+                      db: Session = Depends(get_db)):
+    try:
+        return await user_service.create_user_async(db=db, user=user)
+    except user_service.EmailAlreadyRegisteredError:
         raise HTTPException(status_code=HTTP_400_BAD_REQUEST,
                             detail="Email already registered")
-    return user_service.create_user(db=db, user=user)
 
 
 @router.get("/me", response_model=user_schema.User, tags=['users'])
 async def read_users_me(
         current_user: user_schema.User = Depends(get_current_active_user)):
-    return current_user
+    return RawJSONResponse(user_row(current_user))
+
+
+@router.post("/import",
+             response_model=user_schema.ImportResult,
+             tags=['users'])
+async def import_users(
+        file: UploadFile = File(...),
+        format: str = Query(None, regex='^(csv|ndjson)$'),
+        batch_size: int = Query(1000, ge=1, le=10000),
+        db: Session = Depends(get_db),
+        current_user: user_schema.User = Depends(get_current_active_user)):
+    """ Create users in bulk from a CSV (with a header line) or NDJSON
+        file, inserted batch_size rows per transaction.
+
+        Rows carry name, email, picture, optionally is_active, and either
+        a plaintext password or a password_hash exported by another
+        server. Rows that can not be imported are listed in rejected.
+        Imports run one at a time, others are rejected with a 503.
+    """
+    pool = bulk_user_service.import_hash_pool
+    if pool.running:
+        raise HTTPException(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Another import is running, try again later",
+            headers={"Retry-After": "10"},
+        )
+
+    format = format or bulk_user_service.guess_format(file.filename)
+    lines = codecs.iterdecode(file.file, 'utf-8-sig')
+
+    pool.running = True
+    try:
+        return await run_sync(bulk_user_service.import_users, db, lines,
+                              format, batch_size, pool.executor)
+    finally:
+        pool.running = False
+
+
+@router.get("/export", tags=['users'])
+async def export_users(
+        format: str = Query(bulk_user_service.NDJSON,
+                            regex='^(csv|ndjson)$'),
+        db: Session = Depends(get_read_db),
+        current_user: user_schema.User = Depends(get_current_active_user)):
+    """ Stream every user as CSV or NDJSON, without password hashes """
+    return StreamingResponse(
+        bulk_user_service.export_users(db, format),
+        media_type=bulk_user_service.MEDIA_TYPES[format],
+        headers={
+            'Content-Disposition': f'attachment; filename="users.{format}"'
+        })
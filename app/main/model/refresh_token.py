@@ -0,0 +1,23 @@
+import datetime
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
+from app.database import db
+
+
+class RefreshToken(db.Model):
+    """ Opaque refresh token. Only the SHA-256 hash of the token is stored;
+        tokens rotated from one login share a family_id """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    user_id = Column(Integer,
+                     ForeignKey('users.id', ondelete='CASCADE'),
+                     nullable=False,
+                     index=True)
+    family_id = Column(String(32), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    used_at = Column(DateTime, nullable=True)
+    revoked = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime,
+                        nullable=False,
+                        default=datetime.datetime.utcnow)
@@ -0,0 +1,18 @@
+import datetime
+from sqlalchemy import Column, Integer, String, DateTime
+from app.database import db
+
+
+class RevokedToken(db.Model):
+    """ jti of a revoked token, kept until the token would have expired.
+        Workers load the rows revoked since their last sync """
+    __tablename__ = "revoked_tokens"
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    jti = Column(String(32), nullable=False, unique=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime,
+                        nullable=False,
+                        index=True,
+                        default=datetime.datetime.utcnow)
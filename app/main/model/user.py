@@ -1,8 +1,10 @@
 import datetime
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy import (Boolean, Column, ForeignKey, Integer, String,
+                        DateTime, Index, func)
 from sqlalchemy_utils import PasswordType, force_auto_coercion
 from sqlalchemy_utils.types.encrypted.encrypted_type import AesEngine
 from app.database import db
+from app.main.services.password_service import password_policy
 
 force_auto_coercion()
 
@@ -14,7 +16,7 @@ class User(db.Model):
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    password = Column(PasswordType(schemes=['bcrypt']), nullable=True)
+    password = Column(PasswordType(onload=password_policy), nullable=True)
     name = Column(String(255), nullable=False)
     email = Column(String(255), nullable=False)
     picture = Column(String(), nullable=False)
@@ -23,5 +25,9 @@ class User(db.Model):
                         nullable=False,
                         default=datetime.datetime.utcnow)
 
+    __table_args__ = (Index('ix_users_email_lower',
+                            func.lower(email),
+                            unique=True), )
+
     def as_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
@@ -6,6 +6,10 @@ class JwksItem(BaseModel):
     kid: str = None
     kty: str = None
     n: str = None
+    e: str = None
+    crv: str = None
+    x: str = None
+    y: str = None
     use: str = None
 
 class Jwks(BaseModel):
@@ -7,10 +7,14 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: str = None
+    jti: str = None
 
 class RefreshToken(BaseModel):
     refresh_token: str
 
+class RevokeToken(BaseModel):
+    token: str
+
 class SocialToken(BaseModel):
     token: str
     provider: str
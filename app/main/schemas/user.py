@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel, EmailStr, validator
+from pydantic import BaseModel, EmailStr, root_validator, validator
 
 
 class UserBase(BaseModel):
@@ -28,4 +28,34 @@ class User(UserBase):
     updated_at: datetime
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+class UserImport(UserBase):
+    """ Row of a bulk import, with either a plaintext password or the hash
+        exported by another server """
+    password: Optional[str] = None
+    password_hash: Optional[str] = None
+    is_active: bool = True
+
+    @root_validator(skip_on_failure=True)
+    def check_one_password(cls, values):
+        if bool(values.get('password')) == bool(values.get('password_hash')):
+            raise ValueError('one of password or password_hash is required')
+
+        return values
+
+
+class ImportRejectedRow(BaseModel):
+    line: int
+    email: Optional[str]
+    error: str
+
+
+class ImportResult(BaseModel):
+    imported: int
+    rejected: List[ImportRejectedRow]
+    hashed: int
+    hash_seconds: float
+    elapsed_seconds: float
+    users_per_second: float
@@ -0,0 +1,299 @@
+import csv
+import io
+import json
+import logging
+import time
+from datetime import datetime
+from pydantic import ValidationError
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy_utils import Password
+from app.config import appConfig
+from app.main.model.user import User
+from app.main.schemas import user as user_schema
+from app.main.services.password_service import bulk_executor, hash_many
+from app.main.services.user_service import USER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+
+MEDIA_TYPES = {CSV: 'text/csv', NDJSON: 'application/x-ndjson'}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def guess_format(filename: str, default: str = NDJSON):
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension in FORMATS:
+        return extension
+    if extension in ('json', 'jsonl'):
+        return NDJSON
+    return default
+
+
+def read_rows(lines, format: str):
+    """ Parse CSV (with a header line) or NDJSON text lines, yielding
+        (line number, dict) per row. Rows that can not be parsed are
+        yielded as (line number, error message). """
+    if format == CSV:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            # Empty CSV cells stand for missing values
+            yield reader.line_num, {
+                k: v
+                for k, v in row.items() if k is not None and v != ''
+            }
+    elif format == NDJSON:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as err:
+                yield number, f'Invalid JSON: {str(err)}'
+                continue
+
+            if not isinstance(row, dict):
+                yield number, 'Invalid JSON: expected an object'
+                continue
+            yield number, row
+    else:
+        raise ImportFormatError(f'Unsupported format: {format}')
+
+
+def describe_error(err: Exception):
+    if isinstance(err, ValidationError):
+        return '; '.join(
+            f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+            for error in err.errors())
+    return str(err)
+
+
+def check_password_hash(user: user_schema.UserImport, context):
+    """ Hashes are imported as they are, as long as their scheme is one the
+        server can verify """
+    if (user.password_hash
+            and context.identify(user.password_hash, required=False) is None):
+        raise ValueError('password_hash: unsupported hash scheme')
+
+
+def user_values(user: user_schema.UserImport, password: Password):
+    return dict(name=user.name,
+                email=user.email,
+                picture=user.picture,
+                is_active=user.is_active,
+                password=password,
+                updated_at=datetime.utcnow())
+
+
+def reject(result: dict, line: int, email: str, error: str):
+    result['rejected'].append(dict(line=line, email=email, error=error))
+
+
+def insert_batch(db: Session, batch: list, result: dict, executor=None):
+    """ Insert a batch of (line number, UserImport) with one executemany.
+
+        Emails already registered are dropped first, then the plaintext
+        passwords left are hashed in parallel by executor.
+    """
+    emails = {user.email.lower() for _, user in batch}
+    registered = {
+        email
+        for email, in db.query(func.lower(User.email)).filter(
+            func.lower(User.email).in_(emails))
+    }
+
+    users = []
+    for line, user in batch:
+        email = user.email.lower()
+        if email in registered:
+            reject(result, line, user.email, 'Email already registered')
+            continue
+
+        registered.add(email)
+        users.append((line, user))
+
+    if not users:
+        return
+
+    start = time.perf_counter()
+    secrets = [user.password for _, user in users if not user.password_hash]
+    hashes = iter(hash_many(secrets, executor))
+    result['hashed'] += len(secrets)
+    result['hash_seconds'] += time.perf_counter() - start
+
+    rows = [(line,
+             user_values(
+                 user,
+                 Password(user.password_hash.encode('utf8'))
+                 if user.password_hash else next(hashes)))
+            for line, user in users]
+
+    table = User.__table__
+    try:
+        db.execute(table.insert(), [values for _, values in rows])
+        db.commit()
+        result['imported'] += len(rows)
+        return
+    except IntegrityError:
+        # Registered concurrently, retry one row at a time to find it
+        db.rollback()
+
+    for line, values in rows:
+        try:
+            db.execute(table.insert(), values)
+            db.commit()
+            result['imported'] += 1
+        except IntegrityError:
+            db.rollback()
+            reject(result, line, values['email'], 'Email already registered')
+
+
+def import_users(db: Session,
+                 lines,
+                 format: str = NDJSON,
+                 batch_size: int = 1000,
+                 executor=None):
+    """ Create users from CSV or NDJSON lines, committing every
+        batch_size rows.
+
+        Rows take name, email, picture, is_active and either password or
+        password_hash. Plaintext passwords are hashed by executor, a pool
+        of PASSWORD_BULK_HASH_WORKERS processes for this call by default.
+        Invalid rows and emails already registered are skipped and
+        reported in rejected, along with the throughput of the run.
+    """
+    if executor is None:
+        with bulk_executor() as executor:
+            return import_users(db, lines, format, batch_size, executor)
+
+    context = User.__table__.c.password.type.context
+    result = dict(imported=0, rejected=[], hashed=0, hash_seconds=0.0)
+    start = time.perf_counter()
+    batch = []
+
+    for line, row in read_rows(lines, format):
+        if isinstance(row, str):
+            reject(result, line, None, row)
+            continue
+
+        try:
+            user = user_schema.UserImport(**row)
+            check_password_hash(user, context)
+        except (ValidationError, ValueError) as err:
+            reject(result, line, row.get('email'), describe_error(err))
+            continue
+
+        batch.append((line, user))
+        if len(batch) >= batch_size:
+            insert_batch(db, batch, result, executor)
+            batch = []
+
+    if batch:
+        insert_batch(db, batch, result, executor)
+
+    elapsed = time.perf_counter() - start
+    result.update(elapsed_seconds=elapsed,
+                  users_per_second=result['imported'] /
+                  elapsed if elapsed else 0.0)
+    result['rejected'].sort(key=lambda row: row['line'])
+
+    logger.info(f'{result["imported"]} users imported in {elapsed:.2f}s, '
+                f'{len(result["rejected"])} rows rejected')
+    return result
+
+
+class ImportHashPool():
+    """ Process pool hashing the passwords of POST /users/import.
+
+        It is started on the first import and kept for the next ones, with
+        PASSWORD_IMPORT_HASH_WORKERS processes, so imports never take more
+        cores from the auth workers. One import runs at a time per worker.
+    """
+    def __init__(self):
+        self.config = appConfig
+        self._executor = None
+        self.running = False
+
+    def init_app(self, app):
+        app.add_event_handler('shutdown', self.shutdown)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = bulk_executor(
+                workers=self.config.PASSWORD_IMPORT_HASH_WORKERS)
+
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+def export_fields(include_password: bool = False):
+    fields = [column.key for column in USER_COLUMNS]
+    if include_password:
+        fields.append('password_hash')
+    return fields
+
+
+def export_rows(db: Session,
+                include_password: bool = False,
+                batch_size: int = 1000):
+    columns = USER_COLUMNS
+    if include_password:
+        columns += (User.password, )
+
+    query = db.query(*columns).order_by(User.id).execution_options(
+        stream_results=True)
+
+    for row in query.yield_per(batch_size):
+        data = row._asdict()
+        data['updated_at'] = row.updated_at.isoformat()
+        if include_password:
+            password = data.pop('password')
+            data['password_hash'] = (password.hash.decode('utf8')
+                                     if password is not None else None)
+        yield data
+
+
+def export_users(db: Session,
+                 format: str = NDJSON,
+                 include_password: bool = False,
+                 batch_size: int = 1000):
+    """ Stream every user as CSV or NDJSON lines, in the format read by
+        import_users. Password hashes are only written when asked for. """
+    rows = export_rows(db, include_password, batch_size)
+
+    if format == NDJSON:
+        for row in rows:
+            yield json.dumps(row) + '\n'
+    elif format == CSV:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer,
+                                fieldnames=export_fields(include_password))
+        writer.writeheader()
+
+        for row in rows:
+            writer.writerow(row)
+
+            # Send the rows in chunks rather than one write per line
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+    else:
+        raise ImportFormatError(f'Unsupported format: {format}')
+
+
+import_hash_pool = ImportHashPool()
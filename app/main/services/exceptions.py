@@ -0,0 +1,14 @@
+class ProviderUnsupportedError(Exception):
+    pass
+
+
+class SocialTokenError(Exception):
+    pass
+
+
+class ProviderUnavailableError(Exception):
+    pass
+
+
+class UserNotFoundError(Exception):
+    pass
@@ -1,21 +1,27 @@
-import aiohttp
 from http import HTTPStatus
-from aiohttp.resolver import AsyncResolver
-from aiohttp import web
+from app.config import appConfig
+from app.http_client import http_client
+from .exceptions import ProviderUnavailableError, SocialTokenError
 
+FACEBOOK_PROVIDER = 'facebook'
+
+# Responses meaning the token itself was rejected, as opposed to rate
+# limits and outages of the Graph API
+INVALID_TOKEN_STATUSES = (HTTPStatus.BAD_REQUEST, HTTPStatus.UNAUTHORIZED,
+                          HTTPStatus.FORBIDDEN)
 
-async def get_user_data(token):
-    base_url = 'https://graph.facebook.com'
-    url = f"{base_url}/me?access_token={token}&fields=id,email"
 
-    data = {}
-    status = HTTPStatus.SERVICE_UNAVAILABLE
+async def get_user_data(token):
+    url = f"{appConfig.FACEBOOK_GRAPH_URL}/me"
+    params = {'access_token': token, 'fields': 'id,email'}
 
-    async with aiohttp.ClientSession(connector=None) as session:
-        async with session.get(url) as response:
-            data = await response.json()
-            status = response.status
-            if status >= HTTPStatus.BAD_REQUEST:
-                raise SocialTokenError(data)
+    status, data = await http_client.get_json(FACEBOOK_PROVIDER,
+                                              url,
+                                              params=params)
+    if status in INVALID_TOKEN_STATUSES:
+        raise SocialTokenError(data)
+    if status >= HTTPStatus.BAD_REQUEST:
+        raise ProviderUnavailableError(
+            f'{FACEBOOK_PROVIDER} answered {status}, try again later')
 
     return data
@@ -0,0 +1,199 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from sqlalchemy_utils import Password
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+from app.config import BaseConfig, appConfig
+
+logger = logging.getLogger(__name__)
+
+
+def password_policy(config: BaseConfig = appConfig, **kwargs):
+    """ CryptContext options of the PASSWORD_* settings.
+
+        Every scheme but the first is deprecated and costs are also minimums,
+        so verify_and_update returns a new hash for any older one.
+    """
+    return dict(kwargs,
+                schemes=list(config.PASSWORD_SCHEMES),
+                deprecated='auto',
+                bcrypt__default_rounds=config.PASSWORD_BCRYPT_ROUNDS,
+                bcrypt__min_rounds=config.PASSWORD_BCRYPT_ROUNDS,
+                argon2__time_cost=config.PASSWORD_ARGON2_TIME_COST,
+                argon2__memory_cost=config.PASSWORD_ARGON2_MEMORY_COST,
+                argon2__parallelism=config.PASSWORD_ARGON2_PARALLELISM)
+
+
+def calibrate(scheme: str = 'bcrypt',
+              target: float = 0.25,
+              config: BaseConfig = appConfig):
+    """ Highest cost of scheme whose verification takes at most target
+        seconds on this machine, as the settings to apply.
+
+        bcrypt is tuned through its rounds. For argon2 the memory cost is
+        kept and the time cost raised.
+    """
+    if scheme == 'bcrypt':
+        setting, cost = 'PASSWORD_BCRYPT_ROUNDS', 4
+    elif scheme == 'argon2':
+        setting, cost = 'PASSWORD_ARGON2_TIME_COST', 1
+    else:
+        raise ValueError(f'Unsupported scheme: {scheme}')
+
+    def verify_time(cost):
+        options = password_policy(config)
+        options.update(schemes=[scheme],
+                       bcrypt__default_rounds=cost,
+                       bcrypt__min_rounds=cost,
+                       argon2__time_cost=cost)
+        context = CryptContext(**options)
+        hash = context.hash('calibration')
+
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            context.verify('calibration', hash)
+            timings.append(time.perf_counter() - start)
+
+        return min(timings)
+
+    elapsed = verify_time(cost)
+    while True:
+        next_elapsed = verify_time(cost + 1)
+        if next_elapsed > target:
+            break
+        cost, elapsed = cost + 1, next_elapsed
+
+    return {setting: cost}, elapsed
+
+
+def _password_context():
+    from app.main.model.user import User
+    return User.__table__.c.password.type.context
+
+
+def _hash(secret: str):
+    return _password_context().hash(secret)
+
+
+def _verify(secret: str, hash: bytes):
+    return _password_context().verify_and_update(secret, hash)
+
+
+def bulk_executor(size: int = None,
+                  config: BaseConfig = appConfig,
+                  workers: int = None):
+    """ Process pool for hash_many, with PASSWORD_BULK_HASH_WORKERS
+        processes (or workers) or fewer for size passwords.
+
+        Processes are started by a fork server rather than forked from the
+        caller, which may be a multi-threaded server holding locks.
+    """
+    workers = workers or config.PASSWORD_BULK_HASH_WORKERS
+    if size is not None:
+        workers = min(workers, size)
+
+    method = ('forkserver' if 'forkserver'
+              in multiprocessing.get_all_start_methods() else 'spawn')
+    return ProcessPoolExecutor(max_workers=max(1, workers),
+                               mp_context=multiprocessing.get_context(method))
+
+
+def hash_many(secrets, executor=None):
+    """ Hash many passwords at once, spread over the processes of executor
+        (a bulk_executor pool for this call by default), in order """
+    secrets = list(secrets)
+    if len(secrets) <= 1:
+        hashes = [_hash(secret) for secret in secrets]
+    elif executor is None:
+        with bulk_executor(len(secrets)) as executor:
+            return hash_many(secrets, executor)
+    else:
+        # About four chunks per process of the pool actually used
+        workers = getattr(executor, '_max_workers', 1)
+        chunksize = max(1, len(secrets) // (workers * 4))
+        hashes = list(executor.map(_hash, secrets, chunksize=chunksize))
+
+    return [Password(hash.encode('utf8')) for hash in hashes]
+
+
+class PasswordHasher():
+    """ Runs password hashing and verification in a bounded worker pool.
+
+        Requests beyond PASSWORD_HASH_MAX_PENDING in flight are rejected
+        right away with a 503 instead of queueing behind slow bcrypt work.
+    """
+    def __init__(self):
+        self.config = appConfig
+        self._executor = None
+        self.pending = 0
+
+    def init_app(self, app):
+        app.add_event_handler('shutdown', self.shutdown)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            workers = self.config.PASSWORD_HASH_WORKERS
+            if self.config.PASSWORD_HASH_EXECUTOR == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix='password')
+
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def run(self, fn, *args):
+        if self.pending >= self.config.PASSWORD_HASH_MAX_PENDING:
+            logger.warning('Password hashing pool saturated')
+            raise HTTPException(
+                status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor,
+                                              functools.partial(fn, *args))
+        finally:
+            self.pending -= 1
+
+    async def hash(self, secret: str):
+        hash = await self.run(_hash, secret)
+        return Password(hash.encode('utf8'))
+
+    async def verify_and_update(self, password: Password, secret: str):
+        """ Returns (valid, new hash), where the new hash is set when the
+            stored one no longer follows the password policy """
+        if password is None or password.hash is None or secret is None:
+            return False, None
+
+        valid, new_hash = await self.run(_verify, secret, password.hash)
+        if valid and new_hash:
+            return True, Password(new_hash.encode('utf8'))
+
+        return valid, None
+
+    async def verify(self, password: Password, secret: str):
+        valid, new_hash = await self.verify_and_update(password, secret)
+        if new_hash is not None:
+            # Same behaviour as Password.__eq__: keep the upgraded hash.
+            password.hash = new_hash.hash
+            password.changed()
+
+        return valid
+
+
+password_hasher = PasswordHasher()
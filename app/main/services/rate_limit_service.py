@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from app.cache import LRUCache
+from app.config import BaseConfig, appConfig
+from app.database import run_sync
+
+logger = logging.getLogger(__name__)
+
+
+def take_token(tokens: float, updated_at: float, now: float, rate: float,
+               burst: int):
+    """ Refill a token bucket holding tokens at updated_at and take one.
+
+        Returns (tokens left, seconds to wait), where a wait above 0 means
+        the bucket was empty and nothing was taken.
+    """
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+
+    return tokens, (1 - tokens) / rate
+
+
+class LocalRateLimitBackend():
+    """ Per process buckets, bounded in size with LRU eviction. A bucket
+        dropped from the cache was full again anyway or is a cold key. """
+    def __init__(self, maxsize: int):
+        self.buckets = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, rate: float, burst: int, now: float):
+        with self._lock:
+            tokens, updated_at = self.buckets.get(key, (burst, now))
+            tokens, wait = take_token(tokens, updated_at, now, rate, burst)
+            # An untouched bucket is full after burst / rate seconds
+            self.buckets.set(key, (tokens, now), expires_at=now + burst / rate)
+
+        return wait
+
+    def clear(self):
+        self.buckets.clear()
+
+
+class RedisRateLimitBackend():
+    """ Buckets shared by every worker, stored in Redis and updated
+        atomically by a Lua script """
+    prefix = 'bluesky:ratelimit:'
+
+    script = """
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local tokens = tonumber(bucket[1]) or burst
+        local updated_at = tonumber(bucket[2]) or now
+
+        tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+
+        redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate))
+        return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.take = self.client.register_script(self.script)
+
+    def hit(self, key: str, rate: float, burst: int, now: float):
+        return float(
+            self.take(keys=[self.prefix + key], args=[rate, burst, now]))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class LoginRateLimiter():
+    """ Token buckets throttling login attempts per client IP and per
+        account, checked before any password is verified.
+
+        Buckets hold up to LOGIN_RATE_LIMIT_*_BURST attempts and refill at
+        LOGIN_RATE_LIMIT_*_RATE attempts per second. With
+        LOGIN_RATE_LIMIT_URL they are kept in Redis and shared by every
+        worker; when Redis is unreachable attempts are let through.
+    """
+    def __init__(self, config: BaseConfig = appConfig, shared=None):
+        self.config = config
+        self.local = LocalRateLimitBackend(config.LOGIN_RATE_LIMIT_SIZE)
+        self.shared = shared
+
+        if self.shared is None and config.LOGIN_RATE_LIMIT_URL:
+            self.shared = RedisRateLimitBackend(config.LOGIN_RATE_LIMIT_URL)
+
+    @property
+    def enabled(self):
+        return self.config.LOGIN_RATE_LIMIT_ENABLED
+
+    def limits(self, ip: str, username: str):
+        return [
+            (f'ip:{ip}', self.config.LOGIN_RATE_LIMIT_IP_RATE,
+             self.config.LOGIN_RATE_LIMIT_IP_BURST),
+            (f'account:{username.lower()}',
+             self.config.LOGIN_RATE_LIMIT_ACCOUNT_RATE,
+             self.config.LOGIN_RATE_LIMIT_ACCOUNT_BURST),
+        ]
+
+    def hit(self, ip: str, username: str):
+        """ Count a login attempt. Returns the seconds to wait before
+            trying again, 0 when the attempt may proceed. """
+        if not self.enabled:
+            return 0.0
+
+        backend = self.shared or self.local
+        now = time.time()
+
+        for key, rate, burst in self.limits(ip, username):
+            try:
+                wait = backend.hit(key, rate, burst, now)
+            except Exception as err:
+                logger.error(f'Shared rate limiter unavailable: {str(err)}')
+                return 0.0
+
+            # The account bucket is left untouched when the IP is throttled
+            if wait > 0:
+                logger.warning(f'Login attempts throttled for {key}')
+                return wait
+
+        return 0.0
+
+    async def hit_async(self, ip: str, username: str):
+        if self.shared is None:
+            return self.hit(ip, username)
+
+        return await run_sync(self.hit, ip, username)
+
+    def reset(self):
+        self.local.clear()
+
+        if self.shared is not None:
+            self.shared.clear()
+
+
+login_rate_limiter = LoginRateLimiter()
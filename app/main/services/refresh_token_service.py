@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from app.config import BaseConfig
+from app.database import delete_expired
+from app.main.model.refresh_token import RefreshToken
+from app.main.model.user import User
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidRefreshTokenError(Exception):
+    pass
+
+
+class RefreshTokenReusedError(InvalidRefreshTokenError):
+    pass
+
+
+def hash_token(token: str):
+    return hashlib.sha256(token.encode('utf8')).hexdigest()
+
+
+def issue(db: Session, user: User, config: BaseConfig, family_id=None):
+    """ Store a new opaque refresh token for user and return it """
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.utcnow() + timedelta(
+        minutes=config.REFRESH_TOKEN_EXPIRE_MINUTES)
+
+    db.add(
+        RefreshToken(token_hash=hash_token(token),
+                     user_id=user.id,
+                     family_id=family_id or uuid.uuid4().hex,
+                     expires_at=expires_at))
+    db.commit()
+
+    return token
+
+
+def rotate(db: Session, token: str, config: BaseConfig):
+    """ Exchange a refresh token for a new one of the same family.
+
+        Returns (user, new refresh token). Presenting a token that was
+        already rotated revokes its whole family, since either the client
+        or an attacker holds a stolen copy.
+    """
+    now = datetime.utcnow()
+    row = db.query(RefreshToken, User).join(
+        User, User.id == RefreshToken.user_id).filter(
+            RefreshToken.token_hash == hash_token(token)).first()
+
+    if row is None:
+        raise InvalidRefreshTokenError('Incorrect token')
+
+    refresh_token, user = row
+    if refresh_token.revoked or refresh_token.expires_at <= now:
+        raise InvalidRefreshTokenError('Incorrect token')
+
+    # Conditional update so two concurrent rotations cannot both succeed
+    claimed = db.query(RefreshToken).filter(
+        RefreshToken.id == refresh_token.id,
+        RefreshToken.used_at.is_(None)).update({'used_at': now},
+                                               synchronize_session=False)
+
+    if not claimed:
+        revoke_family(db, refresh_token.family_id)
+        logger.warning(f'Refresh token reused, family '
+                       f'{refresh_token.family_id} revoked')
+        raise RefreshTokenReusedError('Incorrect token')
+
+    return user, issue(db, user, config, refresh_token.family_id)
+
+
+def revoke_family(db: Session, family_id: str):
+    db.query(RefreshToken).filter(RefreshToken.family_id == family_id).update(
+        {'revoked': True}, synchronize_session=False)
+    db.commit()
+
+
+def purge_expired(db: Session, batch_size: int = 1000):
+    """ Delete expired refresh tokens in batches of batch_size rows, each
+        in its own transaction, and return the number deleted """
+    return delete_expired(db, RefreshToken, batch_size)
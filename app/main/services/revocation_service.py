@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.bloom import BloomFilter
+from app.config import appConfig
+from app.database import delete_expired, run_sync
+from app.main.model.revoked_token import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationList():
+    """ Revoked token ids, checked on every authenticated request.
+
+        Each worker keeps a bloom filter of the revoked jtis and loads new
+        rows from the revoked_tokens table at most once every
+        REVOCATION_REFRESH_INTERVAL seconds. Every sync reads again the
+        rows revoked up to REVOCATION_SYNC_MARGIN seconds before the
+        previous one, so rows committed late or out of order are not
+        missed. Tokens whose jti is not in the filter are accepted without
+        touching the database; only filter hits are confirmed against the
+        table.
+    """
+    def __init__(self):
+        self.config = appConfig
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bloom = BloomFilter(self.config.REVOCATION_BLOOM_CAPACITY,
+                                 self.config.REVOCATION_BLOOM_ERROR_RATE)
+        self.synced_at = None
+        self.refreshed_at = None
+
+    @property
+    def stale(self):
+        return (self.refreshed_at is None
+                or time.monotonic() - self.refreshed_at >=
+                self.config.REVOCATION_REFRESH_INTERVAL)
+
+    def refresh(self, db: Session):
+        with self._lock:
+            if not self.stale:
+                return
+
+            if self.synced_at is None:
+                self.rebuild(db)
+            else:
+                now = datetime.utcnow()
+                since = self.synced_at - timedelta(
+                    seconds=self.config.REVOCATION_SYNC_MARGIN)
+                jtis = [
+                    jti for jti, in db.query(RevokedToken.jti).filter(
+                        RevokedToken.revoked_at >= since)
+                ]
+
+                # Rows of the overlap window are already in the filter
+                added = [jti for jti in jtis if jti not in self.bloom]
+                if len(self.bloom) + len(added) > self.bloom.capacity:
+                    self.rebuild(db)
+                else:
+                    for jti in added:
+                        self.bloom.add(jti)
+                    self.synced_at = now
+
+            self.refreshed_at = time.monotonic()
+
+    def rebuild(self, db: Session):
+        """ Start a new filter from the revocations still in force, sized
+            for at least twice as many entries """
+        now = datetime.utcnow()
+        jtis = [
+            jti for jti, in db.query(RevokedToken.jti).filter(
+                RevokedToken.expires_at > now)
+        ]
+
+        capacity = max(self.config.REVOCATION_BLOOM_CAPACITY, 2 * len(jtis))
+        bloom = BloomFilter(capacity, self.config.REVOCATION_BLOOM_ERROR_RATE)
+        for jti in jtis:
+            bloom.add(jti)
+
+        self.bloom = bloom
+        self.synced_at = now
+        logger.info(f'Revocation filter rebuilt with {len(jtis)} entries')
+
+    def is_stored(self, db: Session, jti: str):
+        return db.query(
+            db.query(RevokedToken).filter(
+                RevokedToken.jti == jti).exists()).scalar()
+
+    async def is_revoked_async(self, db: Session, jti: str):
+        if jti is None:
+            # Tokens issued without a jti can not be revoked
+            return False
+
+        if self.stale:
+            await run_sync(self.refresh, db)
+
+        if jti not in self.bloom:
+            return False
+
+        return await run_sync(self.is_stored, db, jti)
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime):
+        """ Revoke jti, returning False when it was already revoked """
+        db.add(RevokedToken(jti=jti, expires_at=expires_at))
+        try:
+            db.commit()
+            revoked = True
+        except IntegrityError:
+            db.rollback()
+            revoked = False
+
+        self.bloom.add(jti)
+        return revoked
+
+
+def purge_expired(db: Session, batch_size: int = 1000):
+    """ Delete revocations of tokens that have expired anyway, in batches
+        of batch_size rows, and return the number deleted """
+    return delete_expired(db, RevokedToken, batch_size)
+
+
+revocation_list = RevocationList()
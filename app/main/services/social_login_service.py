@@ -1,45 +1,76 @@
+import hashlib
 import logging
+import time
+from app.cache import LRUCache
+from app.config import appConfig
+from app.metrics import metrics
 from ..services import user_service, facebook_service
 from ..schemas import token
+from .exceptions import (ProviderUnsupportedError, SocialTokenError,
+                         UserNotFoundError)
 
 BLUESKY_PROVIDER = 'bluesky'
 FACEBOOK_PROVIDER = 'facebook'
 
 logger = logging.getLogger(__name__)
 
-
-class ProviderUnsupportedError(Exception):
-    pass
-
-
-class SocialTokenError(Exception):
-    pass
-
-
-class UserNotFoundError(Exception):
-    pass
+# (provider, token digest) -> (provider data, error) of recent lookups
+social_token_cache = LRUCache(maxsize=appConfig.SOCIAL_TOKEN_CACHE_SIZE)
 
 
 class SocialLoginService():
     def __init__(self):
-        pass
+        self.config = appConfig
 
-    async def get_user(self, db, social_token: token.SocialToken):
-        user = None
-        data = None
+    async def get_provider_data(self, social_token: token.SocialToken):
+        """ Resolve the provider identity of a social token.
+
+            Results are cached for SOCIAL_TOKEN_CACHE_TTL seconds and
+            rejected tokens for SOCIAL_TOKEN_NEGATIVE_CACHE_TTL seconds, so
+            clients retrying the same token do not call the provider again.
+            Provider outages and rate limits are not cached.
+        """
+        digest = hashlib.sha256(social_token.token.encode('utf8')).digest()
+        key = (social_token.provider, digest)
+
+        cached = social_token_cache.get(key)
+        if cached is not None:
+            data, error = cached
+            if error is not None:
+                raise SocialTokenError(error)
+            return data
 
         if social_token.provider == FACEBOOK_PROVIDER:
-            data = await facebook_service.get_user_data(social_token.token)
+            get_user_data = facebook_service.get_user_data
         else:
             raise ProviderUnsupportedError(
                 f'Unsupported provider: {social_token.provider}')
 
+        try:
+            with metrics.stage('social_swap', 'provider_call'):
+                data = await get_user_data(social_token.token)
+        except SocialTokenError as err:
+            ttl = self.config.SOCIAL_TOKEN_NEGATIVE_CACHE_TTL
+            social_token_cache.set(key, (None, str(err)), time.time() + ttl)
+            raise
+
+        if data is not None:
+            ttl = self.config.SOCIAL_TOKEN_CACHE_TTL
+            social_token_cache.set(key, (data, None), time.time() + ttl)
+
+        return data
+
+    async def get_user(self, db, social_token: token.SocialToken):
+        user = None
+        data = await self.get_provider_data(social_token)
+
         if data is None:
             raise SocialTokenError()
 
-        user = user_service.get_user(db, email=data['email'])
-        print(data)
+        with metrics.stage('social_swap', 'user_lookup'):
+            user = await user_service.get_user_async(db, email=data['email'])
+        logger.debug(f'{social_token.provider} user {data.get("id")} resolved')
         if user is None:
             raise UserNotFoundError('No user found for given credentials')
 
-        return user
\ No newline at end of file
+        return user
@@ -0,0 +1,150 @@
+import json
+import logging
+import time
+from datetime import datetime
+from sqlalchemy_utils import Password
+from app.cache import LRUCache
+from app.main.model.user import User
+
+logger = logging.getLogger(__name__)
+
+
+def dump_user(user: User):
+    data = user.as_dict()
+    data['updated_at'] = user.updated_at.isoformat()
+    data['password'] = (user.password.hash.decode('utf8')
+                        if user.password is not None else None)
+    return json.dumps(data)
+
+
+def load_user(raw):
+    data = json.loads(raw)
+    data['updated_at'] = datetime.fromisoformat(data['updated_at'])
+    if data['password'] is not None:
+        data['password'] = Password(data['password'])
+    return User(**data)
+
+
+class LocalUserCacheBackend():
+    """ Per process cache, bounded in size with LRU eviction """
+    def __init__(self, maxsize: int):
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl: float):
+        self.cache.set(key, value, expires_at=time.time() + ttl)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class RedisUserCacheBackend():
+    """ Cache shared by every worker, stored in Redis """
+    prefix = 'bluesky:user:'
+
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl: float):
+        self.client.set(self.prefix + key, value, ex=int(ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class UserCache():
+    """ Read-through cache for user lookups by email.
+
+        Users are looked up in the local backend first and then in the
+        optional shared backend, which holds serialized rows. Entries are
+        dropped on every write to the user (see invalidate).
+    """
+    def __init__(self, config, shared=None):
+        self.ttl = config.USER_CACHE_TTL
+        self.enabled = config.USER_CACHE_SIZE > 0
+        self.local = LocalUserCacheBackend(config.USER_CACHE_SIZE)
+        self.shared = shared
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+        if self.shared is None and config.USER_CACHE_URL:
+            self.shared = RedisUserCacheBackend(config.USER_CACHE_URL)
+
+    @staticmethod
+    def key(email: str):
+        return email.lower()
+
+    def get(self, email: str):
+        if not self.enabled:
+            return None
+
+        key = self.key(email)
+        raw = self.local.get(key)
+
+        if raw is None and self.shared is not None:
+            try:
+                raw = self.shared.get(key)
+            except Exception as err:
+                logger.error(f'Shared user cache unavailable: {str(err)}')
+
+            if raw is None:
+                self.shared_misses += 1
+            else:
+                self.shared_hits += 1
+                self.local.set(key, raw, self.ttl)
+
+        return load_user(raw) if raw is not None else None
+
+    def set(self, user: User):
+        if not self.enabled:
+            return
+
+        key = self.key(user.email)
+        raw = dump_user(user)
+        self.local.set(key, raw, self.ttl)
+
+        if self.shared is not None:
+            try:
+                self.shared.set(key, raw, self.ttl)
+            except Exception as err:
+                logger.error(f'Shared user cache unavailable: {str(err)}')
+
+    def invalidate(self, email: str):
+        key = self.key(email)
+        self.local.delete(key)
+
+        if self.shared is not None:
+            try:
+                self.shared.delete(key)
+            except Exception as err:
+                logger.error(f'Shared user cache unavailable: {str(err)}')
+
+    def clear(self):
+        self.local.clear()
+
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        stats = self.local.cache.stats()
+        stats.update(shared_hits=self.shared_hits,
+                     shared_misses=self.shared_misses)
+
+        hits = stats['hits'] + self.shared_hits
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = hits / lookups if lookups else 0.0
+
+        return stats
@@ -1,41 +1,126 @@
+import calendar
+import hashlib
 import jwt
+import uuid
 from datetime import datetime, timedelta
 from http import HTTPStatus
 from starlette.status import HTTP_401_UNAUTHORIZED
 from fastapi import HTTPException
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.main.model.user import User
 from app.main.schemas import user as user_schema
-from app.config import BaseConfig
+from app.config import BaseConfig, appConfig
+from app.cache import LRUCache
+from app.keys import key_material
+from app.database import run_sync
+from app.main.services.password_service import password_hasher
+from app.main.services.user_cache import UserCache
 
+verified_token_cache = LRUCache(maxsize=appConfig.VERIFIED_TOKEN_CACHE_SIZE)
+user_cache = UserCache(appConfig)
 
-def get_users(db: Session):
-    return db.query(User).all()
+
+class EmailAlreadyRegisteredError(Exception):
+    pass
+
+
+USER_COLUMNS = (User.id, User.name, User.email, User.picture, User.is_active,
+                User.updated_at)
+
+
+def get_users(db: Session, limit: int = None, after_id: int = None):
+    """ Page of users ordered by id, starting after the after_id cursor """
+    query = db.query(*USER_COLUMNS).order_by(User.id)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    if limit is not None:
+        query = query.limit(limit)
+
+    return [row._asdict() for row in query]
+
+
+def iter_users(db: Session, after_id: int = None, batch_size: int = 1000):
+    """ Stream users ordered by id from a server side cursor """
+    query = db.query(*USER_COLUMNS).order_by(User.id).execution_options(
+        stream_results=True)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+
+    for row in query.yield_per(batch_size):
+        yield row._asdict()
 
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+    user = user_cache.get(email)
+    if user is None:
+        user = db.query(User).filter(
+            func.lower(User.email) == email.lower()).first()
+        if user is not None:
+            user_cache.set(user)
+
+    return user
 
 
-def create_user(db: Session, user: user_schema.UserCreate):
+def create_user(db: Session, user: user_schema.UserCreate, password=None):
+    if password is None:
+        password = user.password
+
     db_user = User(name=user.name,
                    email=user.email,
-                   password=user.password,
+                   password=password,
                    picture=user.picture)
     db.add(db_user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Unique violation on ix_users_email_lower
+        db.rollback()
+        raise EmailAlreadyRegisteredError(user.email)
+
+    user_cache.invalidate(db_user.email)
     db.refresh(db_user)
     return db_user
 
 
-def get_user_by_email(db: Session, email: str):
-    return db.query(User).filter(User.email == email).first()
+def update_password(db: Session, user: User, password):
+    """ Store a new password hash, e.g. one upgraded to the current policy
+        on login """
+    db.query(User).filter(User.id == user.id).update(
+        {'password': password}, synchronize_session=False)
+    db.commit()
+
+    user_cache.invalidate(user.email)
 
 
 def get_user(db: Session, email: str = None):
     return get_user_by_email(db, email)
 
 
+async def create_user_async(db: Session, user: user_schema.UserCreate):
+    password = await password_hasher.hash(user.password)
+    return await run_sync(create_user, db, user, password)
+
+
+async def update_password_async(db: Session, user: User, password):
+    return await run_sync(update_password, db, user, password)
+
+
+async def get_users_async(db: Session,
+                          limit: int = None,
+                          after_id: int = None):
+    return await run_sync(get_users, db, limit, after_id)
+
+
+async def get_user_by_email_async(db: Session, email: str):
+    return await run_sync(get_user_by_email, db, email)
+
+
+async def get_user_async(db: Session, email: str = None):
+    return await run_sync(get_user, db, email)
+
+
 def create_token(data: dict,
                  expires_delta: timedelta = None,
                  config: BaseConfig = None):
@@ -45,12 +130,59 @@ def create_token(data: dict,
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
 
-    encoded_jwt = jwt.encode(
-        to_encode,
-        config.ACCESS_TOKEN_PRIVATE_KEY,
-        algorithm=config.ACCESS_TOKEN_ALGORITHM,
-        headers={'kid': '3q1sysizPaTHQhb+xErwIZfZymN+46UmssneP0vPkes='})
+    key = key_material.signing_key
+    encoded_jwt = jwt.encode(to_encode,
+                             key.private_key,
+                             algorithm=key.algorithm,
+                             headers={'kid': key.kid})
 
     return encoded_jwt
+
+
+def decode_token(token: str, config: BaseConfig):
+    """ Verify a token with the key named by its kid header """
+    key = key_material.verification_key(token)
+    return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+
+
+def decode_access_token(token: str, config: BaseConfig):
+    """ Verify an access token, reusing the claims of an identical token
+        verified before as long as it has not expired """
+    key = hashlib.sha256(token.encode('utf8')).digest()
+
+    payload = verified_token_cache.get(key)
+    if payload is None:
+        payload = decode_token(token, config)
+
+        if payload.get('exp') is not None:
+            verified_token_cache.set(key, payload, expires_at=payload['exp'])
+
+    return payload
+
+
+USER_CLAIMS = ('sub', 'uid', 'name', 'picture', 'active', 'updated_at')
+
+
+def get_user_claims(user: User):
+    """ Claims embedded in access tokens so the user can be rebuilt
+        without a database lookup (see get_user_from_claims) """
+    return {
+        'uid': user.id,
+        'active': user.is_active,
+        'updated_at': calendar.timegm(user.updated_at.utctimetuple()),
+    }
+
+
+def get_user_from_claims(payload: dict):
+    if any(payload.get(claim) is None for claim in USER_CLAIMS):
+        return None
+
+    return user_schema.User.construct(
+        id=payload['uid'],
+        email=payload['sub'],
+        name=payload['name'],
+        picture=payload['picture'],
+        is_active=payload['active'],
+        updated_at=datetime.utcfromtimestamp(payload['updated_at']))
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from starlette.routing import Match
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+# Seconds between two writes of a worker's metrics to the shared directory
+DUMP_INTERVAL = 1
+
+
+def format_labels(labels: dict):
+    if not labels:
+        return ''
+
+    pairs = ','.join(
+        '{}="{}"'.format(name,
+                         str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels.items())
+    return '{' + pairs + '}'
+
+
+class Counter():
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        for key, value in list(self.values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self.values[key] = value
+
+
+class Histogram():
+    type = 'histogram'
+
+    def __init__(self,
+                 name: str,
+                 help: str,
+                 labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            counts, total, observations = self.values.get(
+                key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, observations + 1)
+
+    def samples(self):
+        for key, (counts, total, observations) in list(self.values.items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + '_bucket', dict(labels, le=bound), count
+
+            yield self.name + '_bucket', dict(labels, le='+Inf'), observations
+            yield self.name + '_count', labels, observations
+            yield self.name + '_sum', labels, total
+
+
+def pid_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge(documents):
+    """ Merge the metric families dumped by every worker.
+
+        Counters and histograms are summed over all the workers, including
+        those that exited, so that totals never go back when a worker is
+        replaced. Gauges are only taken from live workers, each one with a
+        worker label.
+    """
+    families = {}
+
+    for document in documents:
+        live = pid_alive(document['pid'])
+
+        for metric in document['metrics']:
+            family = families.setdefault(metric['name'],
+                                         dict(metric, samples={}))
+            samples = family['samples']
+
+            for name, labels, value in metric['samples']:
+                if metric['type'] == 'gauge':
+                    if not live:
+                        continue
+                    labels = dict(labels, worker=document['worker'])
+
+                key = (name, tuple(labels.items()))
+                if key in samples:
+                    samples[key][2] += value
+                else:
+                    samples[key] = [name, labels, value]
+
+    for family in families.values():
+        family['samples'] = list(family['samples'].values())
+
+    return list(families.values())
+
+
+class Metrics():
+    """ Prometheus style metrics of this worker process.
+
+        Records the latency of every request by route and, through stage,
+        the time spent in each step of the auth flows. Served in the
+        Prometheus text format by GET /metrics.
+
+        Under the prefork server (app.server) every worker also writes its
+        metrics to a directory shared with the others, and GET /metrics
+        serves them merged, whichever worker accepts the scrape.
+    """
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.directory = None
+        self.worker = None
+        self._task = None
+
+        self.request_latency = self.histogram(
+            'http_request_duration_seconds', 'HTTP request latency',
+            ['method', 'route', 'status'])
+        self.stage_latency = self.histogram(
+            'auth_stage_duration_seconds',
+            'Latency of each stage of the auth flows', ['flow', 'stage'])
+
+    def init_app(self, app):
+        app.add_event_handler('startup', self.start)
+        app.add_event_handler('shutdown', self.stop)
+
+        @app.middleware('http')
+        async def record_request_latency(request, call_next):
+            start = time.perf_counter()
+            response = await call_next(request)
+
+            self.request_latency.observe(time.perf_counter() - start,
+                                         method=request.method,
+                                         route=self.route(app, request.scope),
+                                         status=response.status_code)
+            return response
+
+    @staticmethod
+    def route(app, scope):
+        """ Path template of the route serving scope, so that path
+            parameters do not create a series per value """
+        for route in app.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+
+        return 'unmatched'
+
+    def counter(self, name: str, help: str, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), **kwargs):
+        return self.register(Histogram(name, help, labelnames, **kwargs))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def on_collect(self, collector):
+        """ Call collector before every render, to update gauges that
+            mirror state kept elsewhere """
+        self.collectors.append(collector)
+        return collector
+
+    @contextmanager
+    def stage(self, flow: str, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_latency.observe(time.perf_counter() - start,
+                                       flow=flow,
+                                       stage=stage)
+
+    def setup(self, directory: str):
+        """ Directory shared by the workers, set by the master before fork """
+        self.directory = directory
+
+    def bind(self, worker: int):
+        """ Make the current process the worker numbered worker """
+        self.worker = worker
+
+    @property
+    def shared(self):
+        return self.directory is not None and self.worker is not None
+
+    def snapshot(self):
+        for collector in self.collectors:
+            collector()
+
+        return [
+            dict(name=metric.name,
+                 help=metric.help,
+                 type=metric.type,
+                 samples=[[name, labels, value]
+                          for name, labels, value in metric.samples()])
+            for metric in self.metrics
+        ]
+
+    def dump(self):
+        """ Write the metrics of this worker, replacing its previous file """
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        document = dict(pid=os.getpid(),
+                        worker=self.worker,
+                        metrics=self.snapshot())
+
+        with open(path + '.tmp', 'w') as f:
+            json.dump(document, f)
+        os.replace(path + '.tmp', path)
+
+    def load(self):
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.json'):
+                continue
+
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    yield json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(DUMP_INTERVAL)
+            self.dump()
+
+    def start(self):
+        if self.shared:
+            self.dump()
+            self._task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        # Keep the final counts of a worker that is shutting down
+        if self.shared:
+            self.dump()
+
+    def render(self):
+        if self.shared:
+            self.dump()
+            families = merge(self.load())
+        else:
+            families = self.snapshot()
+
+        lines = []
+        for family in families:
+            lines.append(f'# HELP {family["name"]} {family["help"]}')
+            lines.append(f'# TYPE {family["name"]} {family["type"]}')
+            for name, labels, value in family['samples']:
+                lines.append(f'{name}{format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,43 @@
+""" Fast JSON serialization of the API responses.
+
+    orjson (a requirement) is used, ujson when no orjson wheel could be
+    installed. Both write naive datetimes in isoformat, as FastAPI's
+    jsonable_encoder does.
+"""
+import datetime
+import ujson
+from fastapi.responses import Response, UJSONResponse
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+except ImportError:
+    orjson = None
+    ORJSONResponse = None
+
+
+def _default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+
+    return ujson.dumps(content, ensure_ascii=False,
+                       default=_default).encode('utf8')
+
+
+# Response class of every endpoint, set in create_app
+DefaultJSONResponse = ORJSONResponse if orjson is not None else UJSONResponse
+
+
+class RawJSONResponse(Response):
+    """ Response serializing plain rows (dicts, lists, datetimes) straight
+        to bytes, for endpoints that skip response_model validation """
+    media_type = 'application/json'
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,201 @@
+""" Prefork server running the application on every core.
+
+    The master builds the application, loads the token keys and binds the
+    listening socket, then forks the workers, which share them copy-on-write
+    and accept on the same socket. Workers that exit or stop sending
+    heartbeats are replaced. On SIGTERM or SIGINT every worker stops
+    accepting, finishes its requests and runs the shutdown handlers.
+    Workers share their metrics through a temporary directory, so GET
+    /metrics reports all of them.
+
+    Usage:
+        python -m app.server [--host HOST] [--port PORT] [--workers N]
+"""
+import argparse
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import time
+import uvicorn
+from decouple import config
+from app import create_app
+from app.config import BaseConfig, appConfig
+from app.keys import key_material
+from app.metrics import metrics
+from app.workers import worker_health
+
+logger = logging.getLogger(__name__)
+
+# Workers exiting sooner than this after being forked are failing on
+# startup, and are restarted no faster than once per interval
+RESTART_INTERVAL = 1
+
+
+def cpu_count():
+    """ CPUs this process may run on, which can be less than the node's """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class PreforkServer():
+    def __init__(self,
+                 app,
+                 config: BaseConfig = appConfig,
+                 host: str = None,
+                 port: int = None,
+                 workers: int = None,
+                 log_level: str = 'info'):
+        self.config = config
+        self.workers = workers or config.SERVER_WORKERS or cpu_count()
+        self.uvicorn_config = uvicorn.Config(app,
+                                             host=host or config.SERVER_HOST,
+                                             port=port or config.SERVER_PORT,
+                                             lifespan='on',
+                                             log_config=None,
+                                             log_level=log_level)
+        self.socket = None
+        self.children = {}
+        self.started_at = {}
+        self.stopping = False
+
+    def serve(self):
+        # Loaded once here rather than in every worker, a bad key stops
+        # the server before any worker is forked
+        key_material.load()
+        self.socket = self.uvicorn_config.bind_socket()
+        worker_health.setup(self.workers)
+        metrics.setup(tempfile.mkdtemp(prefix='bluesky-metrics-'))
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self.handle_exit)
+
+        logger.info(f'Starting {self.workers} workers')
+        for index in range(self.workers):
+            self.spawn(index)
+
+        try:
+            while not self.stopping:
+                self.reap()
+                self.check_heartbeats()
+                time.sleep(0.1)
+        finally:
+            self.stop()
+
+    def handle_exit(self, sig, frame):
+        self.stopping = True
+
+    def spawn(self, index: int):
+        worker_health.heartbeats[index] = time.time()
+
+        pid = os.fork()
+        if pid == 0:
+            self.run_worker(index)
+
+        self.children[pid] = index
+        self.started_at[index] = time.monotonic()
+        logger.info(f'Worker {index} started (pid {pid})')
+
+    def run_worker(self, index: int):
+        status = 0
+        try:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, signal.SIG_DFL)
+
+            # Out of the master's process group, so that a CTRL+C reaches
+            # the master alone and workers get a single SIGTERM from it
+            os.setpgid(0, 0)
+
+            worker_health.bind(index)
+            metrics.bind(index)
+            uvicorn.Server(self.uvicorn_config).run(sockets=[self.socket])
+        except BaseException:
+            logger.exception(f'Worker {index} failed')
+            status = 1
+        finally:
+            os._exit(status)
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+
+            if pid == 0:
+                return
+
+            index = self.children.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+
+            logger.warning(f'Worker {index} (pid {pid}) exited with status '
+                           f'{status}, restarting')
+
+            if time.monotonic() - self.started_at[index] < RESTART_INTERVAL:
+                time.sleep(RESTART_INTERVAL)
+            self.spawn(index)
+
+    def check_heartbeats(self):
+        for pid, index in list(self.children.items()):
+            if worker_health.age(index) > self.config.SERVER_WORKER_TIMEOUT:
+                logger.error(f'Worker {index} (pid {pid}) timed out')
+                self.kill(pid, signal.SIGKILL)
+                # Not killed again while waiting to be reaped
+                worker_health.heartbeats[index] = time.time()
+
+    def kill(self, pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def stop(self):
+        logger.info('Stopping workers')
+        self.stopping = True
+
+        for pid in self.children:
+            self.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.config.SERVER_GRACEFUL_TIMEOUT
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+
+        for pid, index in self.children.items():
+            logger.warning(f'Worker {index} (pid {pid}) did not stop in time')
+            self.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+        self.children = {}
+        self.socket.close()
+        shutil.rmtree(metrics.directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', help='Address to bind, SERVER_HOST')
+    parser.add_argument('--port', type=int, help='Port to bind, SERVER_PORT')
+    parser.add_argument('--workers',
+                        type=int,
+                        help='Worker processes, SERVER_WORKERS or one per CPU')
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(),
+                        format='%(asctime)s [%(process)d] %(levelname)s '
+                        '%(name)s: %(message)s')
+
+    app = create_app(config('APP_ENV', 'dev'))
+    PreforkServer(app,
+                  host=args.host,
+                  port=args.port,
+                  workers=args.workers,
+                  log_level=args.log_level).serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 1
+
+
+class WorkerHealth():
+    """ Heartbeats of the workers of the prefork server (app.server).
+
+        The master allocates one slot per worker in shared memory before
+        forking. Every worker stamps its slot from its event loop, so a
+        stale heartbeat means a blocked or dead worker, and any worker can
+        report the health of all of them.
+    """
+    def __init__(self):
+        self.heartbeats = None
+        self.index = None
+        self.parent = None
+        self.started_at = time.time()
+        self._task = None
+
+    def init_app(self, app):
+        app.add_event_handler('startup', self.start)
+        app.add_event_handler('shutdown', self.stop)
+
+    def setup(self, workers: int):
+        """ Shared heartbeat slots, allocated by the master before fork """
+        self.heartbeats = multiprocessing.Array('d', workers, lock=False)
+
+    def bind(self, index: int):
+        """ Make the current process the worker of slot index """
+        self.index = index
+        self.parent = os.getppid()
+        self.started_at = time.time()
+        self.beat()
+
+    def beat(self):
+        if self.index is not None:
+            self.heartbeats[self.index] = time.time()
+
+    def age(self, index: int):
+        return time.time() - self.heartbeats[index]
+
+    async def run(self):
+        while True:
+            self.beat()
+
+            # Drain and exit when the master went away without stopping us
+            if os.getppid() != self.parent:
+                logger.error(f'Master {self.parent} exited, stopping worker')
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    def start(self):
+        if self.index is not None:
+            self._task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def status(self):
+        status = dict(pid=os.getpid(),
+                      worker=self.index,
+                      uptime=time.time() - self.started_at)
+
+        if self.heartbeats is not None:
+            status['workers'] = [
+                dict(worker=index, heartbeat_age=self.age(index))
+                for index in range(len(self.heartbeats))
+            ]
+
+        return status
+
+
+worker_health = WorkerHealth()
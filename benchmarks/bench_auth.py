@@ -0,0 +1,140 @@
+""" Micro benchmarks of the auth hot paths, each measured in isolation.
+
+    Covers token signing (user_service.create_token), token verification
+    (get_token_data and the cached decode_access_token), the bcrypt verify
+    done by authenticate_user and get_user_by_email against users tables
+    of several sizes, stored in throwaway SQLite databases.
+
+    Usage:
+        python -m benchmarks.bench_auth [--rows 10000 1000000]
+            [--iterations 500] [--output results.json]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+from benchmarks.common import measure, print_results, summarize, write_results
+from app.config import appConfig
+from app.database import db
+from app.main.controller.auth_controller import get_token_data
+from app.main.model.user import User
+from app.main.services import user_service
+from app.main.services.password_service import password_hasher
+
+SEED_BATCH_SIZE = 10000
+
+
+def use_database(uri: str):
+    appConfig.SQLALCHEMY_DATABASE_URI = uri
+    db.init_app(None)
+    db.Model.metadata.create_all(db.engine)
+
+
+def seed_users(rows: int, password_hash: bytes):
+    """ Insert rows users sharing one precomputed password hash """
+    now = datetime.utcnow()
+    table = User.__table__
+
+    for start in range(0, rows, SEED_BATCH_SIZE):
+        db.engine.execute(table.insert(), [
+            dict(name=f'User {i}',
+                 email=f'user{i}@example.com',
+                 password=password_hash,
+                 picture='http://my_picture_url',
+                 is_active=True,
+                 updated_at=now)
+            for i in range(start, min(rows, start + SEED_BATCH_SIZE))
+        ])
+
+
+def bench_tokens(iterations: int):
+    data = {'sub': 'user@example.com', 'name': 'John Paul'}
+    expires = timedelta(minutes=30)
+    token = user_service.create_token(data, expires, appConfig)
+
+    return [
+        summarize(
+            'create_token',
+            measure(lambda: user_service.create_token(data, expires, appConfig),
+                    iterations)),
+        summarize('get_token_data',
+                  measure(lambda: get_token_data(token, appConfig),
+                          iterations)),
+        summarize(
+            'decode_access_token (cached)',
+            measure(lambda: user_service.decode_access_token(token, appConfig),
+                    iterations)),
+    ]
+
+
+def bench_password(iterations: int, loop):
+    password = loop.run_until_complete(password_hasher.hash('mypassword'))
+
+    def verify():
+        loop.run_until_complete(password_hasher.verify(password, 'mypassword'))
+
+    return summarize('bcrypt verify (authenticate_user)',
+                     measure(verify, iterations),
+                     rounds=password.hash.decode('utf8').split('$')[2])
+
+
+def bench_lookup(rows: int, iterations: int, directory: str):
+    use_database(f'sqlite:///{os.path.join(directory, f"users_{rows}.db")}')
+    seed_users(rows, b'$2b$12$' + b'a' * 53)
+
+    emails = [f'user{random.randrange(rows)}@example.com' for _ in range(64)]
+    session = db.session()
+
+    def lookup():
+        user_service.get_user_by_email(session, random.choice(emails))
+
+    results = []
+    try:
+        user_service.user_cache.enabled = False
+        results.append(
+            summarize(f'get_user_by_email ({rows} rows)',
+                      measure(lookup, iterations)))
+
+        user_service.user_cache.enabled = True
+        results.append(
+            summarize(f'get_user_by_email ({rows} rows, cached)',
+                      measure(lookup, iterations)))
+    finally:
+        session.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows',
+                        type=int,
+                        nargs='+',
+                        default=[10000, 1000000],
+                        help='Users table sizes for the lookup benchmark')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--password-iterations', type=int, default=20)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    results = bench_tokens(args.iterations)
+    results.append(bench_password(args.password_iterations, loop))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            results.extend(bench_lookup(rows, args.iterations, directory))
+
+    password_hasher.shutdown()
+    print_results(results)
+
+    if args.output:
+        write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
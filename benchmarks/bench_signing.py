@@ -0,0 +1,74 @@
+""" Compare token signing algorithms on the login path.
+
+    Times create_full_token (one access and one refresh token, as issued
+    by /auth/token and /auth/refresh-token) and the verification done for
+    every authenticated request, for RSA, ES256 and Ed25519 keys.
+
+    Usage:
+        python -m benchmarks.bench_signing [--iterations N] [--output FILE]
+"""
+import argparse
+import datetime
+from types import SimpleNamespace
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from benchmarks.common import measure, print_results, summarize, write_results
+from app.config import appConfig
+from app.keys import key_material
+from app.main.controller.auth_controller import create_full_token
+from app.main.services import user_service
+
+KEYS = {
+    'RS256 (RSA 2048)':
+    lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    'ES256 (P-256)': lambda: ec.generate_private_key(ec.SECP256R1()),
+    'EdDSA (Ed25519)': lambda: ed25519.Ed25519PrivateKey.generate(),
+}
+
+USER = SimpleNamespace(id=1,
+                       email='user@example.com',
+                       name='John Paul',
+                       picture='http://my_picture_url',
+                       is_active=True,
+                       updated_at=datetime.datetime(2019, 11, 11))
+
+
+def use_key(private_key):
+    key_material.keys = {}
+    key_material.active = key_material.add(private_key,
+                                           private_key.public_key())
+    key_material.loaded = True
+
+
+def bench(iterations: int):
+    results = []
+
+    for name, generate in KEYS.items():
+        use_key(generate())
+        token = create_full_token(USER, appConfig)['access_token']
+
+        issue = measure(lambda: create_full_token(USER, appConfig),
+                        iterations)
+        verify = measure(lambda: user_service.decode_token(token, appConfig),
+                         iterations)
+
+        results.append(summarize(f'login issue {name}', issue))
+        results.append(summarize(f'verify {name}', verify))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    results = bench(args.iterations)
+    print_results(results)
+
+    if args.output:
+        write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
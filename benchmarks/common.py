@@ -0,0 +1,63 @@
+""" Helpers shared by the benchmark scripts """
+import json
+import platform
+import statistics
+import time
+
+
+def percentile(samples: list, fraction: float):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name: str, samples: list, elapsed: float = None, **extra):
+    """ Latency summary of samples (seconds) in microseconds. elapsed is
+        the wall time of the run, for throughput under concurrency """
+    elapsed = elapsed if elapsed is not None else sum(samples)
+
+    result = dict(name=name,
+                  count=len(samples),
+                  mean_us=statistics.mean(samples) * 1e6,
+                  p50_us=percentile(samples, 0.50) * 1e6,
+                  p95_us=percentile(samples, 0.95) * 1e6,
+                  p99_us=percentile(samples, 0.99) * 1e6,
+                  max_us=max(samples) * 1e6,
+                  ops_per_sec=len(samples) / elapsed if elapsed else 0.0)
+    result.update(extra)
+
+    return result
+
+
+def measure(fn, iterations: int, warmup: int = 3):
+    """ Call fn iterations times and return the duration of each call """
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+
+def print_results(results: list):
+    print(f'{"benchmark":<40}{"p50 (us)":>12}{"p99 (us)":>12}'
+          f'{"ops/s":>12}')
+    for result in results:
+        print(f'{result["name"]:<40}{result["p50_us"]:>12.1f}'
+              f'{result["p99_us"]:>12.1f}{result["ops_per_sec"]:>12.1f}')
+
+
+def write_results(results: list, path: str):
+    """ Write results as JSON, along with the environment they ran in """
+    document = dict(created_at=time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                             time.gmtime()),
+                    python=platform.python_version(),
+                    machine=platform.machine(),
+                    results=results)
+
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
@@ -0,0 +1,55 @@
+""" Compare two benchmark result files and flag regressions.
+
+    Usage:
+        python -m benchmarks.compare baseline.json current.json [--threshold 10]
+
+    Exits with status 1 when the p50 or p99 latency of any benchmark grew by
+    more than threshold percent.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str):
+    with open(path) as f:
+        return {result['name']: result for result in json.load(f)['results']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=10.0,
+                        help='Allowed slowdown in percent')
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    current = load(args.current)
+    regressions = 0
+
+    print(f'{"benchmark":<40}{"p50 change":>12}{"p99 change":>12}')
+    for name, result in current.items():
+        if name not in baseline:
+            continue
+
+        changes = []
+        for metric in ('p50_us', 'p99_us'):
+            before = baseline[name][metric]
+            change = (result[metric] - before) / before * 100 if before else 0
+            changes.append(change)
+
+        flag = ''
+        if max(changes) > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+
+        print(f'{name:<40}{changes[0]:>+11.1f}%{changes[1]:>+11.1f}%{flag}')
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
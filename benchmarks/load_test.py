@@ -0,0 +1,217 @@
+""" End to end load test of the auth endpoints.
+
+    Starts the application with uvicorn on a throwaway SQLite database,
+    along with a local stub of the Facebook Graph API, then drives
+    /auth/token, /auth/refresh-token, /users/me, /auth/swap-social-token
+    and the JWKS endpoint with concurrent clients.
+
+    Usage:
+        python -m benchmarks.load_test [--concurrency 32] [--requests 2000]
+            [--scenario token users_me ...] [--output results.json]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from aiohttp import web
+from benchmarks.common import print_results, summarize, write_results
+
+USER = {
+    "name": "John Paul",
+    "picture": "http://my_picture_url",
+    "email": "user@example.com",
+    "password": "mypassword",
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def start_graph_stub(port: int):
+    """ Stub of the Graph API /me endpoint used by facebook_service """
+    async def me(request):
+        return web.json_response({'id': '1', 'email': USER['email']})
+
+    app = web.Application()
+    app.router.add_get('/me', me)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    return runner
+
+
+def start_server(port: int, graph_port: int, directory: str, workers: int):
+    env = dict(os.environ,
+               APP_ENV='prod',
+               DATABASE_URI=f'sqlite:///{os.path.join(directory, "load.db")}',
+               FACEBOOK_GRAPH_URL=f'http://127.0.0.1:{graph_port}',
+               LOGIN_RATE_LIMIT_ENABLED='False')
+
+    migrate = 'from alembic.config import main; main(["upgrade", "head"])'
+    subprocess.run([sys.executable, '-c', migrate],
+                   env=env,
+                   check=True,
+                   stdout=subprocess.DEVNULL)
+
+    command = [
+        sys.executable, '-m', 'uvicorn', 'asgi:app', '--port',
+        str(port), '--workers',
+        str(workers), '--log-level', 'warning'
+    ]
+    return subprocess.Popen(command, env=env)
+
+
+async def wait_until_ready(session, base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f'{base_url}/auth/.well-known/jwks.json'):
+                return
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.2)
+
+    raise RuntimeError('Server did not start')
+
+
+async def login(session, base_url: str):
+    data = {'username': USER['email'], 'password': USER['password']}
+    async with session.post(f'{base_url}/auth/token', data=data) as response:
+        return await response.json()
+
+
+def scenarios(base_url: str):
+    """ name -> coroutine function issuing one request with a client state
+        dict holding its latest tokens """
+    async def jwks(session, state):
+        async with session.get(f'{base_url}/auth/.well-known/jwks.json') as r:
+            await r.read()
+            return r.status
+
+    async def token(session, state):
+        data = {'username': USER['email'], 'password': USER['password']}
+        async with session.post(f'{base_url}/auth/token', data=data) as r:
+            await r.read()
+            return r.status
+
+    async def refresh_token(session, state):
+        json = {'refresh_token': state['refresh_token']}
+        async with session.post(f'{base_url}/auth/refresh-token',
+                                json=json) as r:
+            tokens = await r.json()
+            if r.status == 200:
+                state.update(tokens)
+            return r.status
+
+    async def users_me(session, state):
+        headers = {'Authorization': f'bearer {state["access_token"]}'}
+        async with session.get(f'{base_url}/users/me', headers=headers) as r:
+            await r.read()
+            return r.status
+
+    async def swap_social_token(session, state):
+        json = {'token': 'stub_token', 'provider': 'facebook'}
+        async with session.post(f'{base_url}/auth/swap-social-token',
+                                json=json) as r:
+            await r.read()
+            return r.status
+
+    return dict(jwks=jwks,
+                token=token,
+                refresh_token=refresh_token,
+                users_me=users_me,
+                swap_social_token=swap_social_token)
+
+
+async def run_scenario(name, request, base_url, concurrency, total):
+    samples = []
+    errors = 0
+    remaining = total
+
+    async def client(session, state):
+        nonlocal remaining, errors
+
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            status = await request(session, state)
+            samples.append(time.perf_counter() - start)
+            if status >= 400:
+                errors += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        states = await asyncio.gather(
+            *[login(session, base_url) for _ in range(concurrency)])
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session, state) for state in states])
+        elapsed = time.perf_counter() - start
+
+    return summarize(f'{name} (c={concurrency})',
+                     samples,
+                     elapsed,
+                     errors=errors)
+
+
+async def run(args):
+    port, graph_port = free_port(), free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    graph = await start_graph_stub(graph_port)
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_server(port, graph_port, directory, args.workers)
+        try:
+            async with aiohttp.ClientSession() as session:
+                await wait_until_ready(session, base_url)
+                await session.post(f'{base_url}/users/', json=USER)
+
+            results = []
+            for name, request in scenarios(base_url).items():
+                if args.scenario and name not in args.scenario:
+                    continue
+
+                # bcrypt makes logins orders of magnitude slower
+                total = args.requests
+                if name == 'token':
+                    total = max(args.concurrency, args.requests // 20)
+
+                results.append(await run_scenario(name, request, base_url,
+                                                  args.concurrency, total))
+        finally:
+            server.terminate()
+            server.wait()
+            await graph.cleanup()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests',
+                        type=int,
+                        default=2000,
+                        help='Requests per scenario')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--scenario', nargs='*', help='Scenarios to run')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    args = parser.parse_args()
+
+    results = asyncio.new_event_loop().run_until_complete(run(args))
+    print_results(results)
+
+    if args.output:
+        write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
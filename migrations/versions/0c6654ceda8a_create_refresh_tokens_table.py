@@ -0,0 +1,42 @@
+"""Create refresh tokens table
+
+Revision ID: 0c6654ceda8a
+Revises: 9a5075224886
+Create Date: 2026-10-18 11:03:27.318412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0c6654ceda8a'
+down_revision = '9a5075224886'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'refresh_tokens', sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('token_hash', sa.String(64), nullable=False),
+        sa.Column('user_id',
+                  sa.Integer,
+                  sa.ForeignKey('users.id', ondelete='CASCADE'),
+                  nullable=False),
+        sa.Column('family_id', sa.String(32), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('used_at', sa.DateTime(), nullable=True),
+        sa.Column('revoked', sa.Boolean, nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.UniqueConstraint('token_hash'))
+
+    op.create_index('ix_refresh_tokens_user_id', 'refresh_tokens',
+                    ['user_id'])
+    op.create_index('ix_refresh_tokens_family_id', 'refresh_tokens',
+                    ['family_id'])
+    op.create_index('ix_refresh_tokens_expires_at', 'refresh_tokens',
+                    ['expires_at'])
+
+
+def downgrade():
+    op.drop_table('refresh_tokens')
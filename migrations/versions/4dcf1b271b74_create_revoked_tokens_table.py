@@ -0,0 +1,32 @@
+"""Create revoked tokens table
+
+Revision ID: 4dcf1b271b74
+Revises: 0c6654ceda8a
+Create Date: 2026-10-18 12:21:45.907133
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4dcf1b271b74'
+down_revision = '0c6654ceda8a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revoked_tokens',
+                    sa.Column('id', sa.Integer, primary_key=True),
+                    sa.Column('jti', sa.String(32), nullable=False),
+                    sa.Column('expires_at', sa.DateTime(), nullable=False),
+                    sa.Column('revoked_at', sa.DateTime(), nullable=False),
+                    sa.UniqueConstraint('jti'),
+                    sqlite_autoincrement=True)
+
+    op.create_index('ix_revoked_tokens_expires_at', 'revoked_tokens',
+                    ['expires_at'])
+
+
+def downgrade():
+    op.drop_table('revoked_tokens')
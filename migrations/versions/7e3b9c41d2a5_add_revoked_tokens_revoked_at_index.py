@@ -0,0 +1,23 @@
+"""Add index on revoked tokens revoked_at
+
+Revision ID: 7e3b9c41d2a5
+Revises: 4dcf1b271b74
+Create Date: 2026-10-18 21:52:10.318204
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '7e3b9c41d2a5'
+down_revision = '4dcf1b271b74'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_revoked_tokens_revoked_at', 'revoked_tokens',
+                    ['revoked_at'])
+
+
+def downgrade():
+    op.drop_index('ix_revoked_tokens_revoked_at', table_name='revoked_tokens')
@@ -0,0 +1,37 @@
+"""Add unique index on users email
+
+Revision ID: 9a5075224886
+Revises: 655db8882733
+Create Date: 2026-10-18 10:12:41.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9a5075224886'
+down_revision = '655db8882733'
+branch_labels = None
+depends_on = None
+
+
+def create_index(**kw):
+    op.create_index('ix_users_email_lower',
+                    'users', [sa.text('lower(email)')],
+                    unique=True,
+                    **kw)
+
+
+def upgrade():
+    context = op.get_context()
+
+    if context.dialect.name == 'postgresql':
+        # Build the index without locking the users table for writes.
+        with context.autocommit_block():
+            create_index(postgresql_concurrently=True)
+    else:
+        create_index()
+
+
+def downgrade():
+    op.drop_index('ix_users_email_lower', table_name='users')
@@ -4,6 +4,9 @@ from alembic.config import Config
 from starlette.testclient import TestClient
 from app import create_app
 from app.database import db
+from app.main.services import user_service
+from app.main.services.rate_limit_service import login_rate_limiter
+from app.main.services.revocation_service import revocation_list
 from http import HTTPStatus
 
 app = create_app('test')
@@ -23,6 +26,9 @@ def clean_database():
     print("\nCleaning database...")
     for tbl in reversed(db.Model.metadata.sorted_tables):
         db.engine.execute(tbl.delete())
+    user_service.user_cache.clear()
+    revocation_list.reset()
+    login_rate_limiter.reset()
 
 
 @pytest.fixture(scope="module")
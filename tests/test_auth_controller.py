@@ -1,4 +1,8 @@
+import base64
+import jwt
 import pytest
+from passlib.hash import bcrypt
+from sqlalchemy_utils import Password
 from alembic.command import upgrade
 from alembic.config import Config
 from starlette.testclient import TestClient
@@ -7,7 +11,11 @@ from app.database import db
 from http import HTTPStatus
 from .base_test import BaseTest, database_config
 from app.main.services.social_login_service import SocialLoginService
-from app.main.services import user_service
+from app.main.services import user_service, refresh_token_service
+from app.config import appConfig
+from app.keys import key_material
+from app.main.model.user import User
+from app.main.services.rate_limit_service import login_rate_limiter
 
 
 def create_user():
@@ -20,6 +28,11 @@ def create_user():
                                     })
 
 
+def b64url_decode_uint(value):
+    data = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+    return int.from_bytes(data, 'big')
+
+
 def get_token(username, password):
     response = BaseTest.client.post("/auth/token",
                                     data={
@@ -50,6 +63,45 @@ class TestAuthController(BaseTest):
         assert 'access_token' in data
         assert 'refresh_token' in data
 
+    def test_login_rate_limit(self, database_config, monkeypatch):
+        """ Test login attempts beyond the account burst get a 429 """
+        monkeypatch.setattr(appConfig, 'LOGIN_RATE_LIMIT_ACCOUNT_BURST', 1)
+        login_rate_limiter.reset()
+
+        response = BaseTest.client.post("/auth/token",
+                                        data={
+                                            'username': 'user@example.com',
+                                            'password': 'wrongpassword'
+                                        })
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+        response = BaseTest.client.post("/auth/token",
+                                        data={
+                                            'username': 'user@example.com',
+                                            'password': 'mypassword'
+                                        })
+        assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        assert int(response.headers['Retry-After']) >= 1
+
+        login_rate_limiter.reset()
+
+    def test_rehash_on_login(self, database_config):
+        """ Test an outdated password hash is replaced on login """
+        session = db.session()
+        user = user_service.get_user(session, email='user@example.com')
+        old_hash = bcrypt.using(rounds=4).hash('mypassword').encode('utf8')
+        user_service.update_password(session, user, Password(old_hash))
+
+        get_token('user@example.com', 'mypassword')
+
+        session.expire_all()
+        user = session.query(User).filter(User.id == user.id).one()
+        session.close()
+
+        rounds = appConfig.PASSWORD_BCRYPT_ROUNDS
+        assert user.password.hash.startswith(f'$2b${rounds:02d}$'.encode())
+        assert user.password == 'mypassword'
+
     def test_get_jwks(self, database_config):
         response = BaseTest.client.get("/auth/.well-known/jwks.json",
                                        data={
@@ -63,6 +115,46 @@ class TestAuthController(BaseTest):
         data = response.json()
         assert 'keys' in data
 
+    def test_get_jwks_before_startup(self, database_config, monkeypatch):
+        """ Test the JWKS loads the keys when the startup hook did not """
+        monkeypatch.setattr(key_material, 'loaded', False)
+        monkeypatch.setattr(key_material, '_jwks', None)
+        monkeypatch.setattr(key_material, '_jwks_etag', None)
+
+        response = BaseTest.client.get("/auth/.well-known/jwks.json")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()['keys']
+        assert response.headers['ETag'] == key_material.jwks_etag
+
+    def test_get_jwks_key(self, database_config):
+        """ Test the JWKS publishes the verification key """
+        response = BaseTest.client.get("/auth/.well-known/jwks.json")
+
+        key = response.json()['keys'][0]
+        numbers = key_material.public_key.public_numbers()
+
+        assert key['kty'] == 'RSA'
+        assert key['kid'] == key_material.kid
+        assert b64url_decode_uint(key['n']) == numbers.n
+        assert b64url_decode_uint(key['e']) == numbers.e
+
+        token = get_token('user@example.com', 'mypassword')
+        header = jwt.get_unverified_header(token['access_token'])
+        assert header['kid'] == key['kid']
+
+    def test_get_jwks_not_modified(self, database_config):
+        """ Test the JWKS supports conditional requests """
+        response = BaseTest.client.get("/auth/.well-known/jwks.json")
+
+        etag = response.headers['ETag']
+        assert 'max-age' in response.headers['Cache-Control']
+
+        response = BaseTest.client.get("/auth/.well-known/jwks.json",
+                                       headers={'If-None-Match': etag})
+
+        assert response.status_code == HTTPStatus.NOT_MODIFIED
+
     def test_get_refresh_token(self, database_config):
         token = get_token('user@example.com', 'mypassword')
         response = BaseTest.client.post("/auth/refresh-token",
@@ -77,6 +169,66 @@ class TestAuthController(BaseTest):
         assert 'access_token' in data
         assert 'refresh_token' in data
 
+    def test_opaque_refresh_token_rotation(self, database_config,
+                                           monkeypatch):
+        """ Test opaque refresh tokens rotate and detect reuse """
+        monkeypatch.setattr(appConfig, 'REFRESH_TOKEN_MODE', 'opaque')
+
+        first = get_token('user@example.com', 'mypassword')['refresh_token']
+        assert '.' not in first
+
+        response = BaseTest.client.post("/auth/refresh-token",
+                                        json={'refresh_token': first})
+        assert response.status_code == HTTPStatus.OK
+        second = response.json()['refresh_token']
+        assert second != first
+
+        response = BaseTest.client.post("/auth/refresh-token",
+                                        json={'refresh_token': first})
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+        # Reuse of the first token revoked the whole family
+        response = BaseTest.client.post("/auth/refresh-token",
+                                        json={'refresh_token': second})
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    def test_legacy_refresh_token_exchanged_once(self, database_config,
+                                                 monkeypatch):
+        """ Test a JWT refresh token is exchanged for an opaque one once,
+            and access tokens are not exchanged at all """
+        token = get_token('user@example.com', 'mypassword')
+        monkeypatch.setattr(appConfig, 'REFRESH_TOKEN_MODE', 'opaque')
+
+        response = BaseTest.client.post(
+            "/auth/refresh-token",
+            json={'refresh_token': token['refresh_token']})
+        assert response.status_code == HTTPStatus.OK
+        assert '.' not in response.json()['refresh_token']
+
+        response = BaseTest.client.post(
+            "/auth/refresh-token",
+            json={'refresh_token': token['refresh_token']})
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+        response = BaseTest.client.post(
+            "/auth/refresh-token",
+            json={'refresh_token': token['access_token']})
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+
+    def test_purge_expired_refresh_tokens(self, database_config,
+                                          monkeypatch):
+        """ Test expired refresh tokens are purged in batches """
+        session = db.session()
+        user = user_service.get_user(session, email='user@example.com')
+
+        monkeypatch.setattr(appConfig, 'REFRESH_TOKEN_EXPIRE_MINUTES', -1)
+        for _ in range(3):
+            refresh_token_service.issue(session, user, appConfig)
+
+        assert refresh_token_service.purge_expired(session, batch_size=2) >= 3
+        assert refresh_token_service.purge_expired(session) == 0
+        session.close()
+
     def test_swap_token(self, database_config):
         class SocialLoginServiceFake():
             def __init__(self):
@@ -0,0 +1,22 @@
+from app.bloom import BloomFilter
+
+
+class TestBloomFilter():
+    def test_no_false_negatives(self):
+        """ Test every added item is reported as present """
+        bloom = BloomFilter(capacity=1000)
+        items = [f'jti-{i}' for i in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        assert all(item in bloom for item in items)
+        assert len(bloom) == 1000
+
+    def test_false_positive_rate(self):
+        """ Test the false positive rate stays near the configured one """
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        assert false_positives < 300
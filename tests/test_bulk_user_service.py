@@ -0,0 +1,69 @@
+import json
+import pytest
+from app.database import db
+from app.main.services import user_service
+from app.main.services.bulk_user_service import (ImportFormatError,
+                                                 guess_format, import_users,
+                                                 read_rows)
+from .base_test import database_config
+
+
+def test_read_csv_rows():
+    """ Test CSV rows are read by header, empty cells being missing """
+    lines = [
+        'name,email,picture,password\n',
+        'John Paul,user@example.com,http://my_picture_url,\n',
+    ]
+
+    assert list(read_rows(lines, 'csv')) == [(2, {
+        'name': 'John Paul',
+        'email': 'user@example.com',
+        'picture': 'http://my_picture_url'
+    })]
+
+
+def test_read_ndjson_rows():
+    """ Test NDJSON lines that are not objects are reported """
+    lines = ['{"name": "John Paul"}\n', '\n', '[1]\n', '{broken\n']
+
+    rows = list(read_rows(lines, 'ndjson'))
+
+    assert rows[0] == (1, {'name': 'John Paul'})
+    assert rows[1] == (3, 'Invalid JSON: expected an object')
+    assert rows[2][0] == 4
+    assert rows[2][1].startswith('Invalid JSON')
+
+
+def test_read_unsupported_format():
+    with pytest.raises(ImportFormatError):
+        list(read_rows([], 'xml'))
+
+
+def test_guess_format():
+    assert guess_format('users.csv') == 'csv'
+    assert guess_format('users.jsonl') == 'ndjson'
+    assert guess_format(None) == 'ndjson'
+
+
+def test_import_users_hashes_in_parallel(database_config):
+    """ Test plaintext passwords of an import are hashed by the pool """
+    lines = [
+        json.dumps(dict(name='John Paul',
+                        picture='http://my_picture_url',
+                        email=f'bulk{number}@example.com',
+                        password=f'bulk{number}password')) + '\n'
+        for number in range(3)
+    ]
+
+    session = db.session()
+    try:
+        result = import_users(session, lines)
+
+        assert result['imported'] == 3
+        assert result['hashed'] == 3
+        assert result['users_per_second'] > 0
+
+        user = user_service.get_user(session, 'bulk2@example.com')
+        assert user.password == 'bulk2password'
+    finally:
+        session.close()
@@ -0,0 +1,73 @@
+import time
+from app.cache import LRUCache
+from app.config import appConfig
+from app.main.services import user_service
+
+
+class TestLRUCache():
+    def test_evicts_least_recently_used(self):
+        """ Test the oldest untouched entry is evicted first """
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        assert cache.evictions == 1
+
+    def test_expired_entries_are_misses(self):
+        """ Test entries are not served after their expiry time """
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1, expires_at=time.time() - 1)
+        cache.set('b', 2, expires_at=time.time() + 60)
+
+        assert cache.get('a') is None
+        assert cache.get('b') == 2
+        assert len(cache) == 1
+
+    def test_stats(self):
+        """ Test hit and miss counters """
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_ratio'] == 0.5
+
+
+class TestVerifiedTokenCache():
+    def decode_counting(self, monkeypatch, exp):
+        calls = []
+
+        def decode_token(token, config):
+            calls.append(token)
+            return dict(sub='user@example.com', exp=exp)
+
+        user_service.verified_token_cache.clear()
+        monkeypatch.setattr(user_service, 'decode_token', decode_token)
+        return calls
+
+    def test_token_verified_once(self, monkeypatch):
+        """ Test an identical token is only verified the first time """
+        calls = self.decode_counting(monkeypatch, time.time() + 60)
+
+        first = user_service.decode_access_token('token', appConfig)
+        second = user_service.decode_access_token('token', appConfig)
+
+        assert first == second
+        assert calls == ['token']
+
+    def test_expired_token_not_served(self, monkeypatch):
+        """ Test a cached token is verified again once past its exp """
+        calls = self.decode_counting(monkeypatch, time.time() - 1)
+
+        user_service.decode_access_token('token', appConfig)
+        user_service.decode_access_token('token', appConfig)
+
+        assert calls == ['token', 'token']
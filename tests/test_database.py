@@ -0,0 +1,57 @@
+from app.config import TestConfig
+from app.database import SQLAlchemy, TimedQueuePool, engine_options
+
+
+class PoolConfig(TestConfig):
+    DB_POOL_SIZE = 3
+    DB_MAX_OVERFLOW = 2
+    DB_STATEMENT_TIMEOUT = 5000
+
+
+def test_engine_options_postgres():
+    options = engine_options('postgresql://user@localhost/bluesky',
+                             PoolConfig())
+
+    assert options['poolclass'] is TimedQueuePool
+    assert options['pool_size'] == 3
+    assert options['max_overflow'] == 2
+    assert options['pool_pre_ping'] is True
+    assert options['executemany_mode'] == 'values'
+    assert options['connect_args'] == {
+        'options': '-c statement_timeout=5000'
+    }
+
+
+def test_engine_options_sqlite():
+    options = engine_options('sqlite:///test.db', PoolConfig())
+
+    assert options == dict(connect_args={"check_same_thread": False})
+
+
+def test_read_session_defaults_to_primary():
+    db = SQLAlchemy()
+    db.config = PoolConfig()
+    db.init_app(None)
+
+    assert db.read_engine is db.engine
+    assert db.read_session.kw['bind'] is db.engine
+
+
+def test_pool_status():
+    config = PoolConfig()
+    config.SQLALCHEMY_REPLICA_URI = 'sqlite:///test.db'
+
+    db = SQLAlchemy()
+    db.config = config
+    db.init_app(None)
+    db.read_engine.dispose()
+    db.read_engine.pool = TimedQueuePool(db.read_engine.pool._creator,
+                                         pool_size=3)
+    db.read_engine.pool.bind = 'replica'
+
+    with db.read_engine.connect():
+        status = db.pool_status()
+
+    assert status == {
+        'replica': dict(size=3, checked_out=1, overflow=0, idle=0)
+    }
@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from aiohttp import web
+from app.config import appConfig
+from app.http_client import http_client, ProviderBusyError
+from app.main.services import facebook_service
+from app.main.services.exceptions import (ProviderUnavailableError,
+                                         SocialTokenError)
+
+
+async def graph_me(request):
+    if request.query['access_token'] == 'outage_token':
+        return web.json_response({'error': 'unavailable'}, status=503)
+    if request.query['access_token'] != 'valid_token':
+        return web.json_response({'error': 'invalid token'}, status=400)
+
+    return web.json_response({'id': '1', 'email': 'user@example.com'})
+
+
+def run_with_graph_stub(coroutine_function):
+    async def run():
+        app = web.Application()
+        app.router.add_get('/me', graph_me)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+
+        try:
+            return await coroutine_function(f'http://127.0.0.1:{port}')
+        finally:
+            await http_client.shutdown()
+            await runner.cleanup()
+
+    return asyncio.new_event_loop().run_until_complete(run())
+
+
+class TestFacebookService():
+    def test_get_user_data(self, monkeypatch):
+        """ Test provider data is read through the shared client """
+        async def get_user_data(url):
+            monkeypatch.setattr(appConfig, 'FACEBOOK_GRAPH_URL', url)
+            return await facebook_service.get_user_data('valid_token')
+
+        data = run_with_graph_stub(get_user_data)
+
+        assert data == {'id': '1', 'email': 'user@example.com'}
+
+    def test_get_user_data_invalid_token(self, monkeypatch):
+        """ Test provider errors are raised as SocialTokenError """
+        async def get_user_data(url):
+            monkeypatch.setattr(appConfig, 'FACEBOOK_GRAPH_URL', url)
+            with pytest.raises(SocialTokenError):
+                await facebook_service.get_user_data('invalid_token')
+
+        run_with_graph_stub(get_user_data)
+
+    def test_get_user_data_outage(self, monkeypatch):
+        """ Test provider outages are not raised as invalid tokens """
+        async def get_user_data(url):
+            monkeypatch.setattr(appConfig, 'FACEBOOK_GRAPH_URL', url)
+            with pytest.raises(ProviderUnavailableError):
+                await facebook_service.get_user_data('outage_token')
+
+        run_with_graph_stub(get_user_data)
+
+    def test_concurrency_limit(self, monkeypatch):
+        """ Test requests beyond the concurrency cap are rejected """
+        async def get_user_data(url):
+            monkeypatch.setattr(appConfig, 'FACEBOOK_GRAPH_URL', url)
+            monkeypatch.setattr(appConfig, 'FACEBOOK_MAX_CONCURRENCY', 0)
+            monkeypatch.setattr(appConfig, 'FACEBOOK_CONNECT_TIMEOUT', 0.01)
+            with pytest.raises(ProviderBusyError):
+                await facebook_service.get_user_data('valid_token')
+
+        run_with_graph_stub(get_user_data)
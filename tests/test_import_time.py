@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+from decouple import config
+
+# Seconds allowed to import the ASGI application, including FastAPI,
+# SQLAlchemy and cryptography, so that new workers start serving quickly
+IMPORT_TIME_BUDGET = config('IMPORT_TIME_BUDGET', default=3.0, cast=float)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_asgi(**env):
+    return subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import asgi'],
+        cwd=ROOT,
+        env=dict(os.environ, **env),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True)
+
+
+def cumulative_import_time(stderr: str, module: str):
+    """ Cumulative import time in seconds of module, from -X importtime """
+    for line in stderr.splitlines():
+        fields = [field.strip() for field in line.split('|')]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+
+    raise AssertionError(f'{module} not found in -X importtime output')
+
+
+def test_import_time_budget():
+    """ Test importing the application stays within the startup budget """
+    result = import_asgi()
+
+    assert result.returncode == 0, result.stderr
+    assert cumulative_import_time(result.stderr,
+                                  'asgi') < IMPORT_TIME_BUDGET
+
+
+def test_import_does_not_read_keys():
+    """ Test key files are only read on startup, not on import """
+    result = import_asgi(ACCESS_TOKEN_PRIVATE_KEY='/nonexistent/private.pem',
+                         ACCESS_TOKEN_PUBLIC_KEY='/nonexistent/public.pem')
+
+    assert result.returncode == 0, result.stderr
+    assert 'nonexistent' not in result.stderr
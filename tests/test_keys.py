@@ -0,0 +1,112 @@
+import json
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from app.config import TestConfig
+from app.keys import KeyMaterial, KeyMaterialError
+
+
+def write_private_key(path, kind='RSA'):
+    if kind == 'EC':
+        key = ec.generate_private_key(ec.SECP256R1())
+    elif kind == 'OKP':
+        key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM,
+                            serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption())
+    path.write_bytes(pem)
+
+
+def make_key_material(directory, active_key):
+    class KeyRingConfig(TestConfig):
+        ACCESS_TOKEN_PRIVATE_KEY_FILE = None
+        ACCESS_TOKEN_PUBLIC_KEY_FILE = None
+        ACCESS_TOKEN_KEYS_DIR = str(directory)
+        ACCESS_TOKEN_ACTIVE_KEY = active_key
+
+    key_material = KeyMaterial()
+    key_material.config = KeyRingConfig()
+    key_material.load()
+
+    return key_material
+
+
+def sign(key_material):
+    key = key_material.signing_key
+    return jwt.encode({'sub': 'user@example.com'},
+                      key.private_key,
+                      algorithm=key.algorithm,
+                      headers={'kid': key.kid})
+
+
+class TestKeyMaterial():
+    def test_missing_key_file_fails(self, tmp_path):
+        """ Test a key file that can not be read fails the load """
+        class MissingKeyConfig(TestConfig):
+            ACCESS_TOKEN_PRIVATE_KEY_FILE = str(tmp_path / 'missing.pem')
+
+        key_material = KeyMaterial()
+        key_material.config = MissingKeyConfig()
+
+        with pytest.raises(KeyMaterialError, match='missing.pem'):
+            key_material.load()
+        assert not key_material.loaded
+
+    def test_no_signing_key_fails(self, tmp_path):
+        """ Test a ring without an active private key fails the load """
+        write_private_key(tmp_path / 'key.pem')
+
+        with pytest.raises(KeyMaterialError, match='No signing key'):
+            make_key_material(tmp_path, None)
+
+    def test_rotation(self, tmp_path):
+        """ Test tokens signed before a rotation still verify """
+        write_private_key(tmp_path / 'old.pem')
+        write_private_key(tmp_path / 'new.pem')
+
+        old_keys = make_key_material(tmp_path, 'old.pem')
+        token = sign(old_keys)
+
+        new_keys = make_key_material(tmp_path, 'new.pem')
+        assert new_keys.kid != old_keys.kid
+
+        key = new_keys.verification_key(token)
+        payload = jwt.decode(token, key.public_key, algorithms=['RS256'])
+        assert payload['sub'] == 'user@example.com'
+
+    def test_jwks_publishes_every_key(self, tmp_path):
+        """ Test the JWKS lists all keys of the ring """
+        write_private_key(tmp_path / 'old.pem')
+        write_private_key(tmp_path / 'new.pem')
+
+        key_material = make_key_material(tmp_path, 'new.pem')
+        jwks = json.loads(key_material.jwks)
+
+        assert sorted(key['kid'] for key in jwks['keys']) == sorted(
+            key_material.keys)
+        assert len(jwks['keys']) == 2
+
+    @pytest.mark.parametrize('kind, algorithm, crv', [
+        ('EC', 'ES256', 'P-256'),
+        ('OKP', 'EdDSA', 'Ed25519'),
+    ])
+    def test_elliptic_curve_keys(self, tmp_path, kind, algorithm, crv):
+        """ Test EC and Ed25519 keys sign, verify and publish their JWK """
+        write_private_key(tmp_path / 'key.pem', kind)
+
+        key_material = make_key_material(tmp_path, 'key.pem')
+        token = sign(key_material)
+
+        assert jwt.get_unverified_header(token)['alg'] == algorithm
+
+        key = key_material.verification_key(token)
+        payload = jwt.decode(token, key.public_key, algorithms=[algorithm])
+        assert payload['sub'] == 'user@example.com'
+
+        jwk = json.loads(key_material.jwks)['keys'][0]
+        assert jwk['kty'] == kind
+        assert jwk['crv'] == crv
+        assert jwk['alg'] == algorithm
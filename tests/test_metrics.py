@@ -0,0 +1,82 @@
+from http import HTTPStatus
+import os
+from app.metrics import Histogram, merge
+from .base_test import BaseTest, database_config
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency', 'Latency', ['route'], buckets=(0.1, 1.0))
+    histogram.observe(0.05, route='/a')
+    histogram.observe(0.5, route='/a')
+    histogram.observe(5, route='/a')
+
+    samples = {(name, labels.get('le')): value
+               for name, labels, value in histogram.samples()}
+
+    assert samples[('latency_bucket', 0.1)] == 1
+    assert samples[('latency_bucket', 1.0)] == 2
+    assert samples[('latency_bucket', '+Inf')] == 3
+    assert samples[('latency_count', None)] == 3
+    assert samples[('latency_sum', None)] == 5.55
+
+
+def test_merge_worker_metrics():
+    """ Test counters of every worker, exited ones included, are summed
+        and gauges are only kept for live workers """
+    def document(pid, worker, count, size):
+        return dict(pid=pid,
+                    worker=worker,
+                    metrics=[
+                        dict(name='requests',
+                             help='Requests',
+                             type='counter',
+                             samples=[['requests', {'route': '/'}, count]]),
+                        dict(name='size',
+                             help='Size',
+                             type='gauge',
+                             samples=[['size', {}, size]]),
+                    ])
+
+    exited = 2**22 + 1
+    families = merge([
+        document(os.getpid(), 0, 3, 10),
+        document(exited, 1, 4, 20),
+    ])
+
+    counter, gauge = families
+    assert counter['samples'] == [['requests', {'route': '/'}, 7]]
+    assert gauge['samples'] == [['size', {'worker': 0}, 10]]
+
+
+class TestMetricsController(BaseTest):
+    def test_metrics(self, database_config):
+        """ Test that request latency and auth stage timings are exported """
+        BaseTest.client.post("/users/",
+                             json={
+                                 "name": "John Paul",
+                                 "picture": "http://my_picture_url",
+                                 "email": "user@example.com",
+                                 "password": "mypassword"
+                             })
+        response = BaseTest.client.post("/auth/token",
+                                        data={
+                                            'username': 'user@example.com',
+                                            'password': 'mypassword'
+                                        })
+        token = response.json()['access_token']
+        BaseTest.client.get("/users/me",
+                            headers={'Authorization': f'bearer {token}'})
+
+        response = BaseTest.client.get("/metrics")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers['content-type'].startswith('text/plain')
+
+        body = response.text
+        assert ('http_request_duration_seconds_count{method="POST",'
+                'route="/auth/token",status="200"}') in body
+        assert ('auth_stage_duration_seconds_count{flow="login",'
+                'stage="password_verify"}') in body
+        assert ('auth_stage_duration_seconds_count{flow="verify",'
+                'stage="token_decode"}') in body
+        assert 'cache_size{cache="user"}' in body
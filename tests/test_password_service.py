@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from http import HTTPStatus
+from passlib.context import CryptContext
+from app.config import TestConfig
+from app.main.model.user import User
+from app.main.services.password_service import (PasswordHasher, calibrate,
+                                                hash_many, password_policy)
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class TestPasswordHasher():
+    def test_hash_and_verify(self):
+        """ Test hashing and verification run through the pool """
+        hasher = PasswordHasher()
+
+        password = run(hasher.hash('mypassword'))
+
+        assert password.hash.startswith(b'$2')
+        assert run(hasher.verify(password, 'mypassword'))
+        assert not run(hasher.verify(password, 'wrongpassword'))
+
+        hasher.shutdown()
+
+    def test_saturated_pool_fails_fast(self):
+        """ Test a saturated pool rejects work with 503 """
+        hasher = PasswordHasher()
+        hasher.pending = hasher.config.PASSWORD_HASH_MAX_PENDING
+
+        with pytest.raises(HTTPException) as excinfo:
+            run(hasher.hash('mypassword'))
+
+        assert excinfo.value.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert excinfo.value.headers['Retry-After'] == '1'
+
+
+def test_hash_many():
+    """ Test passwords hashed by the process pool keep their order """
+    secrets = [f'password{i}' for i in range(4)]
+
+    passwords = hash_many(secrets)
+
+    context = User.__table__.c.password.type.context
+    assert len(passwords) == 4
+    assert all(
+        context.verify(secret, password.hash)
+        for password, secret in zip(passwords, secrets))
+
+
+class Argon2Config(TestConfig):
+    PASSWORD_SCHEMES = ['argon2', 'bcrypt']
+    PASSWORD_ARGON2_MEMORY_COST = 1024
+
+
+def test_password_policy():
+    """ Test the first scheme hashes and the others are upgraded """
+    context = CryptContext(**password_policy(Argon2Config()))
+
+    assert context.hash('mypassword').startswith('$argon2')
+
+    old_hash = context.handler('bcrypt').using(rounds=4).hash('mypassword')
+    valid, new_hash = context.verify_and_update('mypassword', old_hash)
+    assert valid
+    assert new_hash.startswith('$argon2')
+
+
+def test_calibrate():
+    """ Test calibration stops at the lowest cost when over target """
+    settings, elapsed = calibrate('bcrypt', target=0)
+
+    assert settings == {'PASSWORD_BCRYPT_ROUNDS': 4}
+    assert elapsed > 0
+
+    with pytest.raises(ValueError):
+        calibrate('md5_crypt')
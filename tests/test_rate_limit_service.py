@@ -0,0 +1,73 @@
+from app.config import TestConfig
+from app.main.services.rate_limit_service import (LoginRateLimiter,
+                                                  take_token)
+
+
+class RateLimitConfig(TestConfig):
+    LOGIN_RATE_LIMIT_ENABLED = True
+    LOGIN_RATE_LIMIT_IP_RATE = 1
+    LOGIN_RATE_LIMIT_IP_BURST = 3
+    LOGIN_RATE_LIMIT_ACCOUNT_RATE = 0.5
+    LOGIN_RATE_LIMIT_ACCOUNT_BURST = 2
+
+
+class SharedRateLimitBackendFake():
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.hits = []
+
+    def hit(self, key, rate, burst, now):
+        if self.fail:
+            raise ConnectionError('redis down')
+
+        self.hits.append(key)
+        return 0.0
+
+    def clear(self):
+        self.hits.clear()
+
+
+def test_take_token():
+    """ Test buckets refill at rate up to burst """
+    assert take_token(0, 0, 10, rate=1, burst=3) == (2, 0.0)
+    assert take_token(0, 0, 0.5, rate=1, burst=3) == (0.5, 0.5)
+
+
+class TestLoginRateLimiter():
+    def test_account_burst(self):
+        """ Test attempts beyond the account burst must wait """
+        limiter = LoginRateLimiter(RateLimitConfig())
+
+        assert limiter.hit('10.0.0.1', 'user@example.com') == 0
+        assert limiter.hit('10.0.0.2', 'USER@example.com') == 0
+        assert limiter.hit('10.0.0.3', 'user@example.com') > 0
+        assert limiter.hit('10.0.0.3', 'other@example.com') == 0
+
+    def test_ip_burst(self):
+        """ Test one IP is throttled across accounts without draining
+            the accounts it targets """
+        limiter = LoginRateLimiter(RateLimitConfig())
+
+        for i in range(3):
+            assert limiter.hit('10.0.0.1', f'user{i}@example.com') == 0
+
+        wait = limiter.hit('10.0.0.1', 'user0@example.com')
+        assert 0 < wait <= 1
+
+        assert limiter.hit('10.0.0.2', 'user0@example.com') == 0
+
+    def test_shared_backend(self):
+        """ Test buckets live in the shared backend when configured """
+        shared = SharedRateLimitBackendFake()
+        limiter = LoginRateLimiter(RateLimitConfig(), shared=shared)
+
+        limiter.hit('10.0.0.1', 'User@example.com')
+
+        assert shared.hits == ['ip:10.0.0.1', 'account:user@example.com']
+
+    def test_shared_backend_unavailable(self):
+        """ Test attempts are let through when the shared backend fails """
+        shared = SharedRateLimitBackendFake(fail=True)
+        limiter = LoginRateLimiter(RateLimitConfig(), shared=shared)
+
+        assert limiter.hit('10.0.0.1', 'user@example.com') == 0
@@ -0,0 +1,32 @@
+import datetime
+import json
+import pytest
+from app import responses
+from app.responses import RawJSONResponse, dumps
+
+ROW = {
+    'id': 1,
+    'name': 'João Paulo',
+    'is_active': True,
+    'updated_at': datetime.datetime(2019, 11, 11, 10, 30, 0, 15),
+}
+
+
+def expected(row):
+    return dict(row, updated_at=row['updated_at'].isoformat())
+
+
+@pytest.mark.parametrize('orjson', [responses.orjson, None])
+def test_dumps(orjson, monkeypatch):
+    """ Test rows serialize the same with orjson and the ujson fallback """
+    monkeypatch.setattr(responses, 'orjson', orjson)
+
+    assert json.loads(dumps(ROW)) == expected(ROW)
+    assert json.loads(dumps([ROW])) == [expected(ROW)]
+
+
+def test_raw_json_response():
+    response = RawJSONResponse([ROW])
+
+    assert response.media_type == 'application/json'
+    assert json.loads(response.body) == [expected(ROW)]
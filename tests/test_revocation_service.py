@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+from app.database import db
+from app.main.model.revoked_token import RevokedToken
+from app.main.services.revocation_service import RevocationList
+from .base_test import BaseTest, database_config
+
+
+class TestRevocationList(BaseTest):
+    def test_sync_loads_rows_committed_out_of_order(self, database_config):
+        """ Test a revocation committed after a later one still reaches
+            the filter of a worker that synced in between """
+        session = db.session()
+        expires_at = datetime.utcnow() + timedelta(hours=1)
+        revocations = RevocationList()
+
+        try:
+            session.add(RevokedToken(id=20, jti='b' * 32,
+                                     expires_at=expires_at))
+            session.commit()
+            revocations.refresh(session)
+            assert 'b' * 32 in revocations.bloom
+
+            # Stamped and given its id before the sync, committed after it
+            session.add(RevokedToken(id=10,
+                                     jti='a' * 32,
+                                     expires_at=expires_at,
+                                     revoked_at=datetime.utcnow() -
+                                     timedelta(seconds=5)))
+            session.commit()
+            revocations.refreshed_at = None
+            revocations.refresh(session)
+
+            assert 'a' * 32 in revocations.bloom
+            assert revocations.is_stored(session, 'a' * 32)
+        finally:
+            session.close()
@@ -0,0 +1,111 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import requests
+from http import HTTPStatus
+from .base_test import BaseTest, database_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_health(url: str, workers: int, timeout: float = 20):
+    """ Health of the server once every worker sends heartbeats """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            health = requests.get(url, timeout=1).json()
+            if all(worker['heartbeat_age'] < 2
+                   for worker in health['workers'][:workers]):
+                return health
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+
+    raise AssertionError(f'{url} not healthy after {timeout}s')
+
+
+class TestHealthController(BaseTest):
+    def test_health(self, database_config):
+        """ Test health of the worker serving the request """
+        response = BaseTest.client.get("/health")
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.json()['status'] == 'ok'
+        assert response.json()['pid'] == os.getpid()
+
+
+def start_server(port: int, workers: int):
+    return subprocess.Popen(
+        [sys.executable, '-m', 'app.server', '--workers',
+         str(workers), '--port',
+         str(port)],
+        cwd=ROOT,
+        env=dict(os.environ, APP_ENV='test', SERVER_GRACEFUL_TIMEOUT='5'),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True)
+
+
+def stop_server(server):
+    """ SIGTERM the server, returning its output """
+    try:
+        server.send_signal(signal.SIGTERM)
+        output, _ = server.communicate(timeout=15)
+    finally:
+        if server.poll() is None:
+            server.kill()
+            server.communicate()
+
+    return output
+
+
+def test_prefork_server_drains_on_sigterm():
+    """ Test the server forks its workers and stops them on SIGTERM """
+    port = free_port()
+    server = start_server(port, 2)
+
+    try:
+        health = wait_for_health(f'http://127.0.0.1:{port}/health', 2)
+        assert [w['worker'] for w in health['workers']] == [0, 1]
+        assert health['pid'] != server.pid
+    finally:
+        output = stop_server(server)
+
+    assert server.returncode == 0, output
+    assert output.count('Application shutdown complete') == 2, output
+
+
+def test_prefork_server_merges_metrics():
+    """ Test every scrape reports the requests of all the workers """
+    port = free_port()
+    server = start_server(port, 2)
+    url = f'http://127.0.0.1:{port}'
+    series = ('http_request_duration_seconds_count{method="GET",'
+              'route="/auth/.well-known/jwks.json",status="200"} 20')
+
+    try:
+        wait_for_health(f'{url}/health', 2)
+
+        # A new connection per request, accepted by either worker
+        for _ in range(20):
+            requests.get(f'{url}/auth/.well-known/jwks.json')
+
+        # Let the other worker write its metrics
+        time.sleep(1.5)
+
+        for _ in range(4):
+            body = requests.get(f'{url}/metrics').text
+            assert series in body
+            assert 'cache_size{cache="user",worker="0"}' in body
+            assert 'cache_size{cache="user",worker="1"}' in body
+    finally:
+        stop_server(server)
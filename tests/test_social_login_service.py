@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from app.main.schemas.token import SocialToken
+from app.main.services import facebook_service, social_login_service
+from app.main.services.exceptions import (ProviderUnavailableError,
+                                         SocialTokenError)
+from app.main.services.social_login_service import SocialLoginService
+
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+class TestSocialLoginService():
+    def setup_method(self):
+        social_login_service.social_token_cache.clear()
+
+    def test_provider_data_is_cached(self, monkeypatch):
+        """ Test a repeated social token calls the provider once """
+        calls = []
+
+        async def get_user_data(token):
+            calls.append(token)
+            return {'id': '1', 'email': 'user@example.com'}
+
+        monkeypatch.setattr(facebook_service, 'get_user_data', get_user_data)
+
+        social_token = SocialToken(token='any_token', provider='facebook')
+        service = SocialLoginService()
+
+        for _ in range(3):
+            data = run(service.get_provider_data(social_token))
+            assert data['email'] == 'user@example.com'
+
+        assert calls == ['any_token']
+
+    def test_invalid_token_is_cached(self, monkeypatch):
+        """ Test a rejected social token is not sent to the provider again """
+        calls = []
+
+        async def get_user_data(token):
+            calls.append(token)
+            raise SocialTokenError('invalid token')
+
+        monkeypatch.setattr(facebook_service, 'get_user_data', get_user_data)
+
+        social_token = SocialToken(token='bad_token', provider='facebook')
+        service = SocialLoginService()
+
+        for _ in range(3):
+            with pytest.raises(SocialTokenError):
+                run(service.get_provider_data(social_token))
+
+        assert calls == ['bad_token']
+
+    def test_provider_outage_is_not_cached(self, monkeypatch):
+        """ Test a token is sent to the provider again after an outage """
+        statuses = [503, 200]
+
+        async def get_user_data(token):
+            if statuses.pop(0) == 503:
+                raise ProviderUnavailableError('facebook answered 503')
+            return {'id': '1', 'email': 'user@example.com'}
+
+        monkeypatch.setattr(facebook_service, 'get_user_data', get_user_data)
+
+        social_token = SocialToken(token='any_token', provider='facebook')
+        service = SocialLoginService()
+
+        with pytest.raises(ProviderUnavailableError):
+            run(service.get_provider_data(social_token))
+
+        data = run(service.get_provider_data(social_token))
+        assert data['email'] == 'user@example.com'
+        assert statuses == []
@@ -0,0 +1,60 @@
+import datetime
+from app.config import TestConfig
+from app.main.model.user import User
+from app.main.services.user_cache import UserCache
+
+
+class SharedUserCacheBackendFake():
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+
+def make_user():
+    return User(id=1,
+                name='John Paul',
+                email='user@example.com',
+                password='mypassword',
+                picture='http://my_picture_url',
+                is_active=True,
+                updated_at=datetime.datetime(2019, 11, 11))
+
+
+class TestUserCache():
+    def test_read_through_shared_backend(self):
+        """ Test a user cached by one worker is served to another """
+        shared = SharedUserCacheBackendFake()
+        UserCache(TestConfig, shared=shared).set(make_user())
+
+        cache = UserCache(TestConfig, shared=shared)
+        user = cache.get('user@example.com')
+
+        assert user.id == 1
+        assert user.updated_at == datetime.datetime(2019, 11, 11)
+        assert user.password == 'mypassword'
+        assert cache.stats()['shared_hits'] == 1
+
+        cache.get('user@example.com')
+        assert cache.stats()['hits'] == 1
+
+    def test_invalidate(self):
+        """ Test invalidation drops the user from every backend """
+        shared = SharedUserCacheBackendFake()
+        cache = UserCache(TestConfig, shared=shared)
+        cache.set(make_user())
+
+        cache.invalidate('user@example.com')
+
+        assert cache.get('user@example.com') is None
+        assert shared.data == {}
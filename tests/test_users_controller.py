@@ -1,10 +1,16 @@
+import csv
+import io
+import json
 import pytest
+from passlib.hash import bcrypt
 from alembic.command import upgrade
 from alembic.config import Config
 from starlette.testclient import TestClient
 from app import create_app
 from app.database import db
 from http import HTTPStatus
+from app.config import appConfig
+from app.main.services import bulk_user_service, user_service
 from .base_test import BaseTest, database_config
 
 
@@ -62,6 +68,23 @@ class TestUserController(BaseTest):
 
         assert response.json() == {"detail": "Email already registered"}
 
+    def test_create_user_already_registred_other_case(self,
+                                                      database_config):
+        """ Test if a user create operation fail if
+            registered with the same email in another case """
+
+        response = BaseTest.client.post("/users/",
+                                        json={
+                                            "name": "John Paul",
+                                            "picture": "http://my_picture_url",
+                                            "email": "USER@example.com",
+                                            "password": "mypassword"
+                                        })
+
+        assert response.status_code == HTTPStatus.BAD_REQUEST
+
+        assert response.json() == {"detail": "Email already registered"}
+
     def test_create_user_with_missing_data(self, database_config):
         """ Test if a user create operation
             fail if created with missing data"""
@@ -97,6 +120,42 @@ class TestUserController(BaseTest):
 
         assert len(response.json()) == 2
 
+    def test_read_users_paginated(self, database_config):
+        """ Read users one page at a time """
+
+        token = get_token('user@example.com', 'mypassword')
+
+        headers = {"Authorization": f"bearer {token}"}
+
+        response = BaseTest.client.get("/users/?limit=1", headers=headers)
+
+        assert response.status_code == HTTPStatus.OK
+        assert [u['email'] for u in response.json()] == ['user@example.com']
+
+        after_id = response.headers['X-Next-After-Id']
+        response = BaseTest.client.get(f"/users/?limit=1&after_id={after_id}",
+                                       headers=headers)
+
+        assert response.status_code == HTTPStatus.OK
+        assert [u['email'] for u in response.json()] == ['user2@example.com']
+
+    def test_read_users_stream(self, database_config):
+        """ Stream all users as NDJSON """
+
+        token = get_token('user@example.com', 'mypassword')
+
+        headers = {"Authorization": f"bearer {token}"}
+
+        response = BaseTest.client.get("/users/?stream=true", headers=headers)
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers['content-type'] == 'application/x-ndjson'
+
+        users = [json.loads(line) for line in response.text.splitlines()]
+        assert [u['email'] for u in users] == [
+            'user@example.com', 'user2@example.com'
+        ]
+
     def test_read_user_me(self, database_config):
         """ Read logged user info from database """
 
@@ -108,4 +167,132 @@ class TestUserController(BaseTest):
 
         assert response.status_code == HTTPStatus.OK
 
-        assert response.json()['email'] == 'user@example.com'
\ No newline at end of file
+        assert response.json()['email'] == 'user@example.com'
+
+    def test_read_user_me_from_token_claims(self, database_config,
+                                            monkeypatch):
+        """ Read logged user info from token claims only """
+
+        token = get_token('user@example.com', 'mypassword')
+
+        async def get_user_async(db, email=None):
+            raise AssertionError('user must not be loaded from database')
+
+        monkeypatch.setattr(appConfig, 'STATELESS_CURRENT_USER', True)
+        monkeypatch.setattr(user_service, 'get_user_async', get_user_async)
+
+        headers = {"Authorization": f"bearer {token}"}
+
+        response = BaseTest.client.get("/users/me", headers=headers)
+
+        assert response.status_code == HTTPStatus.OK
+
+        data = response.json()
+        assert data['email'] == 'user@example.com'
+        assert data['id'] == 1
+        assert data['is_active'] is True
+
+    def test_read_user_me_revoked_token(self, database_config):
+        """ Test a revoked access token is rejected """
+
+        token = get_token('user@example.com', 'mypassword')
+
+        headers = {"Authorization": f"bearer {token}"}
+
+        response = BaseTest.client.get("/users/me", headers=headers)
+        assert response.status_code == HTTPStatus.OK
+
+        response = BaseTest.client.post("/auth/revoke",
+                                        json={'token': token})
+        assert response.status_code == HTTPStatus.OK
+
+        response = BaseTest.client.get("/users/me", headers=headers)
+        assert response.status_code == HTTPStatus.UNAUTHORIZED
+        assert response.json() == {"detail": "Token revoked"}
+
+    def test_import_users(self, database_config):
+        """ Import users from NDJSON, with plaintext passwords and hashes
+            from another server """
+
+        token = get_token('user@example.com', 'mypassword')
+
+        headers = {"Authorization": f"bearer {token}"}
+
+        password_hash = bcrypt.using(rounds=4).hash('importedpassword')
+        rows = [
+            dict(name='Imported 1',
+                 picture='http://my_picture_url',
+                 email='imported1@example.com',
+                 password='importedpassword'),
+            dict(name='Imported 2',
+                 picture='http://my_picture_url',
+                 email='imported2@example.com',
+                 password_hash=password_hash),
+            dict(name='John Paul',
+                 picture='http://my_picture_url',
+                 email='USER@example.com',
+                 password='mypassword'),
+            dict(name='No password',
+                 picture='http://my_picture_url',
+                 email='nopassword@example.com'),
+        ]
+        body = '\n'.join(json.dumps(row) for row in rows) + '\n{broken\n'
+
+        response = BaseTest.client.post(
+            "/users/import",
+            headers=headers,
+            files={'file': ('users.ndjson', body, 'application/x-ndjson')})
+
+        assert response.status_code == HTTPStatus.OK
+
+        data = response.json()
+        assert data['imported'] == 2
+        assert data['hashed'] == 1
+        assert [(row['line'], row['email'])
+                for row in data['rejected']] == [(3, 'USER@example.com'),
+                                                 (4, 'nopassword@example.com'),
+                                                 (5, None)]
+        assert data['rejected'][0]['error'] == 'Email already registered'
+
+        response = BaseTest.client.post("/auth/token",
+                                        data={
+                                            'username':
+                                            'imported2@example.com',
+                                            'password': 'importedpassword'
+                                        })
+        assert response.status_code == HTTPStatus.OK
+
+    def test_import_users_one_at_a_time(self, database_config,
+                                        monkeypatch):
+        """ Test an import is rejected while another one is running """
+        token = get_token('user@example.com', 'mypassword')
+        monkeypatch.setattr(bulk_user_service.import_hash_pool, 'running',
+                            True)
+
+        response = BaseTest.client.post(
+            "/users/import",
+            headers={"Authorization": f"bearer {token}"},
+            files={'file': ('users.ndjson', '{}\n', 'application/x-ndjson')})
+
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response.headers['Retry-After'] == '10'
+
+    def test_export_users(self, database_config):
+        """ Export all users as CSV, without password hashes """
+
+        token = get_token('user@example.com', 'mypassword')
+
+        headers = {"Authorization": f"bearer {token}"}
+
+        response = BaseTest.client.get("/users/export?format=csv",
+                                       headers=headers)
+
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers['content-type'].startswith('text/csv')
+
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [row['email'] for row in rows] == [
+            'user@example.com', 'user2@example.com', 'imported1@example.com',
+            'imported2@example.com'
+        ]
+        assert 'password_hash' not in rows[0]